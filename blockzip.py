@@ -0,0 +1,205 @@
+# ------------------------------------------------------------
+# blockzip.py  –  seekable block-compressed book storage
+# ------------------------------------------------------------
+# Layout:
+#   header   "BCZ1", u16 block_size, u16 reserved
+#   blocks   every block_size bytes of the book as an independent raw
+#            DEFLATE stream (the last block may be shorter)
+#   table    u32 file offset of every block, plus one for the table itself
+#   trailer  u32 uncompressed size, u32 block count, u32 table offset, "BCZ1"
+# Logical offset N lives in block N // block_size, so a seek only ever
+# inflates one block.
+import deflate
+import struct
+from array import array
+from io import BytesIO
+from uzipfile import BufferedSliceReader
+
+MAGIC = b"BCZ1"
+HEADER_FMT = "<4sHH"
+HEADER_SIZE = 8
+TRAILER_FMT = "<III4s"
+TRAILER_SIZE = 16
+BLOCK_SIZE = 4096
+WBITS = 12          # 4 KB window: a block never refers further back
+CACHE_BLOCKS = 2
+
+
+def can_compress() -> bool:
+    """True if this firmware's deflate module was built with compression."""
+    try:
+        _compress(b"x")
+        return True
+    except Exception:
+        return False
+
+
+def _compress(data) -> bytes:
+    buf = BytesIO()
+    d = deflate.DeflateIO(buf, deflate.RAW, WBITS)
+    d.write(data)
+    d.close()
+    return buf.getvalue()
+
+
+class BlockZipWriter:
+    """Sequential writer: buffers block_size bytes, deflates and appends each block."""
+    def __init__(self, out, block_size=BLOCK_SIZE):
+        self.out = out                  # BlockWriter-like: write(), flush(), close()
+        self.block_size = block_size
+        self.buf = bytearray(block_size)
+        self.mv = memoryview(self.buf)
+        self.fill = 0
+        self.raw = 0                    # logical (uncompressed) bytes written
+        self.pos = HEADER_SIZE          # physical offset of the next block
+        self.table = array("I")
+        self.chapters = []
+        out.write(struct.pack(HEADER_FMT, MAGIC, block_size, 0))
+
+    def tell(self):
+        return self.raw
+
+    def mark_chapter(self):
+        self.chapters.append(self.raw)
+
+    def write(self, data):
+        src = memoryview(data)
+        n = len(src)
+        pos = 0
+        while pos < n:
+            take = min(self.block_size - self.fill, n - pos)
+            self.mv[self.fill:self.fill + take] = src[pos:pos + take]
+            self.fill += take
+            pos += take
+            if self.fill == self.block_size:
+                self._emit()
+        self.raw += n
+        return n
+
+    def _emit(self):
+        if not self.fill:
+            return
+        comp = _compress(self.mv[:self.fill])
+        self.table.append(self.pos)
+        self.out.write(comp)
+        self.pos += len(comp)
+        self.fill = 0
+
+    def flush(self):
+        # Blocks must stay block_size long, so only the layer below is flushed
+        self.out.flush()
+
+    def close(self):
+        self._emit()
+        table_offset = self.pos
+        self.table.append(table_offset)
+        for off in self.table:
+            self.out.write(struct.pack("<I", off))
+        self.out.write(struct.pack(TRAILER_FMT, self.raw, len(self.table) - 1, table_offset, MAGIC))
+        self.out.close()
+
+
+class BlockZipFile:
+    """Read-only, seekable file-like view of a block-compressed book with a small LRU of inflated blocks."""
+    def __init__(self, fp, cache_blocks=CACHE_BLOCKS):
+        self.fp = fp
+        fp.seek(0)
+        magic, self.block_size, _ = struct.unpack(HEADER_FMT, fp.read(HEADER_SIZE))
+        fp.seek(-TRAILER_SIZE, 2)
+        self.size, count, table_offset, magic2 = struct.unpack(TRAILER_FMT, fp.read(TRAILER_SIZE))
+        if magic != MAGIC or magic2 != MAGIC:
+            raise OSError("Not a block-compressed book")
+        fp.seek(table_offset)
+        self.table = array("I", fp.read(4 * (count + 1)))
+        self.cache_blocks = cache_blocks
+        self.cache = {}        # block index -> bytes
+        self.order = []        # most recently used last
+        self.pos = 0
+        self.inflated = 0      # blocks decompressed so far
+
+    def _block(self, i):
+        data = self.cache.get(i)
+        if data is not None:
+            self.order.remove(i)
+            self.order.append(i)
+            return data
+        start = self.table[i]
+        reader = BufferedSliceReader(self.fp, start, self.table[i + 1] - start)
+        d = deflate.DeflateIO(reader, deflate.RAW, WBITS)
+        data = d.read()
+        d.close()
+        self.inflated += 1
+        if len(self.order) >= self.cache_blocks:
+            del self.cache[self.order.pop(0)]
+        self.cache[i] = data
+        self.order.append(i)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, min(offset, self.size))
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size < 0 or self.pos + size > self.size:
+            size = self.size - self.pos
+        out = b''
+        while size > 0:
+            block = self._block(self.pos // self.block_size)
+            start = self.pos % self.block_size
+            piece = block[start:start + size]
+            out += piece
+            self.pos += len(piece)
+            size -= len(piece)
+        return out
+
+    def readline(self):
+        out = b''
+        while self.pos < self.size:
+            block = self._block(self.pos // self.block_size)
+            start = self.pos % self.block_size
+            nl = block.find(b"\n", start)
+            end = len(block) if nl == -1 else nl + 1
+            out += block[start:end]
+            self.pos += end - start
+            if nl != -1:
+                break
+        return out
+
+    def close(self):
+        self.cache = {}
+        self.order = []
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_book(path):
+    """Open a book for reading, transparently wrapping block-compressed files."""
+    fp = open(path, "rb")
+    if fp.read(4) == MAGIC:
+        return BlockZipFile(fp)
+    fp.seek(0)
+    return fp
+
+
+def size_of(f) -> int:
+    """Logical size of a book handle (anything with a size attribute, or a plain file)."""
+    size = getattr(f, "size", None)
+    if size is not None:
+        return size
+    pos = f.tell()
+    f.seek(0, 2)
+    n = f.tell()
+    f.seek(pos)
+    return n
@@ -0,0 +1,119 @@
+# ------------------------------------------------------------
+# booksearch.py  –  streaming full-text search in a book file
+# ------------------------------------------------------------
+# Searcher scans the book a block at a time with a Boyer-Moore-Horspool
+# matcher on ASCII case-folded bytes, with every run of whitespace (line
+# breaks of a .pgb or a hard-wrapped .txt too) squeezed to one space in
+# the pattern and the text alike.  The unmatched tail of every block
+# is carried into the next one, so matches across block boundaries are
+# found, and step() returns after each block so the caller can show hits
+# as they come and stop whenever a button is pressed.
+BLOCK_SIZE = 8192
+WHITESPACE = (b"\n", b"\r", b"\t")
+
+
+def fold(data, after_space=False):
+    """
+    (folded, anchors, ends in space): data in ASCII lower case (bytes above
+    0x7F are left alone) with whitespace runs squeezed to one space, all
+    of a leading run if after_space.  anchors are (folded index, data
+    index) pairs from which the two advance together, starting at 0.
+    """
+    s = bytes(data).lower()
+    for ws in WHITESPACE:
+        if ws in s:
+            s = s.replace(ws, b" ")
+    n = len(s)
+    pos = 0
+    if after_space:
+        while pos < n and s[pos] == 32:
+            pos += 1
+    ends_in_space = s[-1] == 32 if n else after_space
+    j = s.find(b"  ", pos)
+    if j < 0:
+        return (s[pos:] if pos else s), [(0, pos)], ends_in_space
+    out = bytearray()
+    anchors = [(0, pos)]
+    while j >= 0:
+        out += s[pos:j + 1]
+        pos = j + 2
+        while pos < n and s[pos] == 32:
+            pos += 1
+        anchors.append((len(out), pos))
+        j = s.find(b"  ", pos)
+    out += s[pos:]
+    return bytes(out), anchors, ends_in_space
+
+
+class Searcher:
+    """Find every occurrence of pattern in f between start and end (None = end of file)."""
+    def __init__(self, f, pattern, start=0, end=None, block_size=BLOCK_SIZE):
+        self.f = f
+        self.pat = fold(pattern)[0]
+        m = len(self.pat)
+        self.skip = bytearray([m] * 256)
+        for i in range(m - 1):
+            self.skip[self.pat[i]] = m - 1 - i
+        self.pos = start           # file offset of the next block
+        self.end = end
+        self.block_size = block_size
+        self.tail = b''            # folded bytes not yet tried as a match start
+        self.anchors = [(0, start)]  # (tail index, file offset) pairs, see fold()
+        self.space = False         # the folded text so far ends in a space
+        self.done = m == 0
+        self.hits = 0
+
+    def step(self) -> list:
+        """Scan the next block and return the offsets of the matches that end in it."""
+        if self.done:
+            return []
+        size = self.block_size
+        if self.end is not None:
+            size = min(size, self.end - self.pos)
+        self.f.seek(self.pos)
+        data = self.f.read(size) if size > 0 else b''
+        if not data:
+            self.done = True
+            return []
+        folded, anchors, self.space = fold(data, self.space)
+        base = len(self.tail)
+        self.anchors += [(base + k, self.pos + d) for k, d in anchors]
+        buf = self.tail + folded
+        self.pos += len(data)
+        pat, skip = self.pat, self.skip
+        m = len(pat)
+        last = m - 1
+        first = pat[last]
+        n = len(buf) - m
+        hits = []
+        i = 0
+        while i <= n:
+            c = buf[i + last]
+            if c == first and buf[i:i + m] == pat:
+                hits.append(self._offset(i))
+            i += skip[c]
+        self._drop(i)
+        self.tail = buf[i:]
+        self.hits += len(hits)
+        return hits
+
+    def _anchor(self, i) -> int:
+        a = self.anchors
+        j = len(a) - 1
+        while a[j][0] > i:
+            j -= 1
+        return j
+
+    def _offset(self, i) -> int:
+        """File offset of folded byte i of the current buffer."""
+        k, off = self.anchors[self._anchor(i)]
+        return off + i - k
+
+    def _drop(self, i):
+        """Forget the buffer before i, which is no longer a possible match start."""
+        a = self.anchors
+        j = self._anchor(i)
+        self.anchors = [(0, self._offset(i))] + [(k - i, off) for k, off in a[j + 1:]]
+
+    def cancel(self):
+        self.done = True
@@ -0,0 +1,120 @@
+# ------------------------------------------------------------
+# booksessions.py  –  recently left books kept warm in RAM
+# ------------------------------------------------------------
+# Opening a book costs an index load from flash, a layout of its page and
+# a prerender of the next one.  When the reader switches away, main.py
+# puts the book's Session here: its PageIndex, reading page, remainders,
+# fingerprint and, if the heap allows, a copy of the framebuffer showing
+# that page.  Switching back takes the session out again and, with a
+# frame, only has to copy it into the framebuffer and refresh once.
+#
+# The cache is sized against free heap, not a fixed count alone: frames
+# are dropped (least recently left book first) while gc.mem_free() is
+# under FRAME_HEAP_MIN, whole sessions while it is under HEAP_MIN.
+import gc
+import os
+
+MAX_SESSIONS = 4
+# an EPUB read in place opens two inflaters (EpubStream, ExtractionJob):
+# 2 x 32 KB windows, their zip/HTML/text/glyph buffers and some slack
+HEAP_MIN = 72 * 1024          # keep at least this much free for reading
+FRAME_HEAP_MIN = 96 * 1024    # only hold frames while this much is free
+SESSION_OVERHEAD = 512        # objects and headers around a session's buffers
+
+
+def free_heap() -> int:
+    gc.collect()
+    # the host has no mem_free(); its heap is never the limit
+    return gc.mem_free() if hasattr(gc, "mem_free") else 1 << 30
+
+
+def _size(path) -> int:
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return -1
+
+
+class Session:
+    """What main.py needs to carry on reading book without touching flash."""
+    def __init__(self, book, key, offsets, remainders, book_end, page, fingerprint, frame=None, body=None):
+        self.book = book
+        self.key = key                  # layout key the offsets were paginated with
+        self.offsets = offsets          # PageIndex
+        self.remainders = remainders
+        self.book_end = book_end
+        self.page = page
+        self.fingerprint = fingerprint  # (size, hash) of the book when it was left
+        self.frame = frame              # framebuffer showing page, or None
+        self.body = body                # main.pgb_body: a .pgb re-wrapped for this layout
+        self.first = offsets[0] if len(offsets) else 0
+
+    def footprint(self) -> int:
+        """Roughly the heap the session keeps alive."""
+        o = self.offsets
+        n = 4 * (len(o.tail) + len(o.sparse) + sum(len(a) for a in o.cache.values()))
+        n += sum(len(r) for r in self.remainders.values())
+        return n + (len(self.frame) if self.frame is not None else 0) + SESSION_OVERHEAD
+
+    def fresh(self, key, index_head=None) -> bool:
+        """
+        True if the session still fits the book and index on flash.
+
+        index_head(path) gives the (layout key, fingerprint, first offset)
+        of an index file, or None; an index file other than the book must
+        still be the one the session was left with, not one evicted and
+        paginated again from another page.
+        """
+        if key != self.key or _size(self.book) != self.fingerprint[0]:
+            return False
+        o = self.offsets
+        if o.path is None or o.count == 0:
+            return True
+        # a file-backed index must not have been evicted or cut short
+        if _size(o.path) < o.base + 4 * o.count:
+            return False
+        return (o.path == self.book or index_head is None
+                or index_head(o.path) == (self.key, self.fingerprint, self.first))
+
+
+class SessionCache:
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = []     # least recently left first
+
+    def books(self) -> tuple:
+        return tuple(s.book for s in self.sessions)
+
+    def room_for_frame(self, size) -> bool:
+        return free_heap() - size >= FRAME_HEAP_MIN
+
+    def put(self, session):
+        self.drop(session.book)
+        self.sessions.append(session)
+        self.trim()
+
+    def take(self, book, key, index_head=None):
+        """The session of book, removed from the cache; None if there is none or it went stale."""
+        for i, s in enumerate(self.sessions):
+            if s.book == book:
+                del self.sessions[i]
+                return s if s.fresh(key, index_head) else None
+        return None
+
+    def drop(self, book):
+        self.sessions = [s for s in self.sessions if s.book != book]
+
+    def clear(self):
+        self.sessions = []
+
+    def trim(self):
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.pop(0)
+        # one collection; what dropping frees is counted, not measured again
+        free = free_heap()
+        for s in self.sessions:
+            if s.frame is not None and free < FRAME_HEAP_MIN:
+                free += len(s.frame)
+                s.frame = None
+        while self.sessions and free < HEAP_MIN:
+            free += self.sessions.pop(0).footprint()
@@ -0,0 +1,272 @@
+# ------------------------------------------------------------
+# buttontrace.py  –  record button presses, replay them as a benchmark
+# ------------------------------------------------------------
+# Set TRACE = "record" in main.py and read as usual: every change of a
+# button main.py polls is appended to TRACE_FILE, timed from the start of
+# the main loop.  With TRACE = "replay" the same loop runs on the recorded
+# presses instead of the real buttons and, for every event, measures
+#
+#   latency  ms from the event to the end of the next display update
+#   layouts  render_page() calls (page layout, drawn or not)
+#   draws    drawing calls on the display (clear, rectangle, text, ...)
+#   writes   write() calls on files opened for writing (flash writes)
+#
+# then prints a report, saves it to REPORT_FILE and ends main.py.  The
+# same Player runs under the host simulator (host/replay.py), where time
+# is the simulated panel and sleep time.
+#
+# Trace file: a "BTR1" line, then one "<ms> <button> <1|0>" line per event.
+import time
+
+try:
+    import builtins
+except ImportError:
+    builtins = None
+
+TRACE_MAGIC = "BTR1"
+TRACE_FILE = "/state/trace.btr"
+REPORT_FILE = "/state/trace_report.txt"
+FLUSH_EVENTS = 32          # recorder: events kept in RAM before appending them
+FLUSH_IDLE_MS = 2000       # recorder: or once the buttons have been left alone this long
+SETTLE_MS = 2000           # replay: how long to wait after the last event
+DRAW_CALLS = ("clear", "rectangle", "pixel", "line", "text")
+
+active = None
+
+
+class ReplayDone(SystemExit):
+    """Raised from display.pressed() once the whole trace has been replayed; ends main.py quietly."""
+
+
+def load(path=TRACE_FILE) -> list:
+    """[(ms, button, down)] of a trace file."""
+    events = []
+    with open(path) as f:
+        if f.readline().strip() != TRACE_MAGIC:
+            raise ValueError("not a button trace: " + path)
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3:
+                events.append((int(parts[0]), int(parts[1]), parts[2] == "1"))
+    return events
+
+
+def save(events, path=TRACE_FILE):
+    with open(path, "w") as f:
+        f.write(TRACE_MAGIC + "\n")
+        for ms, button, down in events:
+            f.write("%d %d %d\n" % (ms, button, 1 if down else 0))
+
+
+# ---------------------------------------------------------------- recording
+class Recorder:
+    """Wraps display.pressed() and logs every change it sees."""
+    def __init__(self, display, path=TRACE_FILE):
+        self.path = path
+        self.poll = display.pressed
+        self.state = {}
+        self.events = []
+        self.t0 = time.ticks_ms()
+        self.last = self.t0
+        save([], path)
+        display.pressed = self.pressed
+
+    def pressed(self, button):
+        down = self.poll(button)
+        now = time.ticks_ms()
+        if self.state.get(button, False) != down:
+            self.state[button] = down
+            self.events.append((time.ticks_diff(now, self.t0), button, down))
+            self.last = now
+        elif self.events and (len(self.events) >= FLUSH_EVENTS
+                              or time.ticks_diff(now, self.last) > FLUSH_IDLE_MS):
+            self.flush()
+        return down
+
+    def flush(self):
+        if not self.events:
+            return
+        try:
+            with open(self.path, "a") as f:
+                for ms, button, down in self.events:
+                    f.write("%d %d %d\n" % (ms, button, 1 if down else 0))
+        except OSError as e:
+            print("trace save failed:", e)
+        self.events = []
+
+
+# ---------------------------------------------------------------- replaying
+class _CountingFile:
+    """A file opened for writing that counts its write() calls for the Player."""
+    def __init__(self, f, player):
+        self.f = f
+        self.player = player
+
+    def write(self, data):
+        self.player.count("writes")
+        return self.f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def __iter__(self):
+        return iter(self.f)
+
+
+class Player:
+    """Feeds a trace to display.pressed() and measures what every event costs."""
+    def __init__(self, display, events, settle_ms=SETTLE_MS):
+        self.display = display
+        self.events = events
+        self.settle_ms = settle_ms
+        self.held = set()
+        self.next = 0                # index of the next event to happen
+        self.waiting = []            # events not followed by an update yet
+        n = len(events)
+        self.latency = [-1] * n
+        self.counts = {"layouts": [0] * n, "draws": [0] * n, "writes": [0] * n}
+        self.restore = []
+        self.t0 = time.ticks_ms()
+        self._wrap(display, "pressed", lambda orig: self.pressed)
+        for name in ("update", "partial_update"):
+            self._wrap(display, name, self._updating)
+        for name in DRAW_CALLS:
+            self._wrap(display, name, lambda orig: self._counting(orig, "draws"))
+        # False if open() can't be wrapped: the writes column then shows "-", not 0
+        self.counts_writes = builtins is not None and self._wrap(builtins, "open", self._opening)
+
+    def _wrap(self, obj, name, make) -> bool:
+        orig = getattr(obj, name, None)
+        if orig is None:
+            return False
+        try:
+            setattr(obj, name, make(orig))
+        except (AttributeError, TypeError):
+            return False  # e.g. builtins can't be overridden in this firmware
+        self.restore.append((obj, name, orig))
+        return True
+
+    def instrument(self, g):
+        """Count render_page() calls of main.py's globals g."""
+        self._wrap_dict(g, "render_page", "layouts")
+
+    def _wrap_dict(self, g, name, what):
+        orig = g[name]
+        g[name] = self._counting(orig, what)
+        self.restore.append((g, name, orig))
+
+    # ------------------------------------------------ wrappers
+    def count(self, what):
+        if self.next:
+            self.counts[what][self.next - 1] += 1
+
+    def _counting(self, orig, what):
+        def call(*args, **kwargs):
+            self.count(what)
+            return orig(*args, **kwargs)
+        return call
+
+    def _updating(self, orig):
+        def update(*args):
+            result = orig(*args)
+            now = self.now()
+            for i in self.waiting:
+                self.latency[i] = now - self.events[i][0]
+            self.waiting = []
+            return result
+        return update
+
+    def _opening(self, orig):
+        def open_(path, mode="r", *args, **kwargs):
+            f = orig(path, mode, *args, **kwargs)
+            if "w" in mode or "a" in mode or "+" in mode:
+                return _CountingFile(f, self)
+            return f
+        return open_
+
+    # ------------------------------------------------ buttons
+    def now(self):
+        return time.ticks_diff(time.ticks_ms(), self.t0)
+
+    def pressed(self, button):
+        now = self.now()
+        while self.next < len(self.events) and self.events[self.next][0] <= now:
+            _, b, down = self.events[self.next]
+            if down:
+                self.held.add(b)
+            else:
+                self.held.discard(b)
+            self.waiting.append(self.next)
+            self.next += 1
+        if self.next == len(self.events) and now > (self.events[-1][0] if self.events else 0) + self.settle_ms:
+            self.unwrap()
+            finish(self)
+            raise ReplayDone()
+        return button in self.held
+
+    # ------------------------------------------------ report
+    def unwrap(self):
+        for obj, name, orig in reversed(self.restore):
+            if isinstance(obj, dict):
+                obj[name] = orig
+            else:
+                setattr(obj, name, orig)
+        self.restore = []
+
+    def report(self) -> str:
+        writes = self.counts["writes"] if self.counts_writes else ["-"] * len(self.events)
+        lines = ["%8s %6s %4s %8s %7s %6s %6s" % ("ms", "button", "down", "latency", "layouts", "draws", "writes")]
+        for i, (ms, button, down) in enumerate(self.events):
+            lat = self.latency[i]
+            lines.append("%8d %6d %4d %8s %7d %6d %6s" % (
+                ms, button, 1 if down else 0, lat if lat >= 0 else "-",
+                self.counts["layouts"][i], self.counts["draws"][i], writes[i]))
+        seen = sorted(lat for lat in self.latency if lat >= 0)
+        if seen:
+            lines.append("updates %d  latency median %d ms  p90 %d ms  max %d ms" % (
+                len(seen), seen[len(seen) // 2], seen[min(len(seen) - 1, len(seen) * 9 // 10)], seen[-1]))
+        lines.append("layouts %d  draws %d  writes %s" % (
+            sum(self.counts["layouts"]), sum(self.counts["draws"]),
+            sum(self.counts["writes"]) if self.counts_writes else "- (open() can't be wrapped)"))
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------------------- main.py
+def start(mode, display, g):
+    """Called by main.py right before its main loop: mode is None, "record" or "replay"."""
+    global active
+    if mode == "record":
+        active = Recorder(display)
+    elif mode == "replay":
+        try:
+            events = load()
+        except (OSError, ValueError) as e:
+            print("no trace to replay:", e)
+            return None
+        active = Player(display, events)
+        active.instrument(g)
+    return active
+
+
+def flush():
+    """Save what the recorder holds (main.py calls this before halting)."""
+    if isinstance(active, Recorder):
+        active.flush()
+
+
+def finish(player, path=REPORT_FILE):
+    """Print the report of a finished replay and save it to path."""
+    text = player.report()
+    print(text)
+    try:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    except OSError as e:
+        print("report save failed:", e)
+    return text
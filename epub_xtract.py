@@ -1,14 +1,39 @@
 # ------------------------------------------------------------
 # epub_xtract.py  –  Badger 2040 EPUB → HTML extractor
 # ------------------------------------------------------------
+import io
 import os
+import struct
 import time
 import machine
-from uzipfile import UZipFile
+try:
+    import _thread
+except ImportError:
+    _thread = None
+import blockzip
+import deflate
+import memstat
+import storage
+import glyphtext
+import pagebook
+from uzipfile import INPUT_BUFFER_SIZE, WBITS, UZipFile
 
 # --- Configuration ------------------------------------------------
 TARGET_DIR = "books"
 MAX_STATUS_LINES = 6
+BLOCK_SIZE = 4096          # LittleFS erase block on the RP2040 flash
+CHUNK_SIZE = 512
+TAG_MAX = 8                # tag bytes kept: enough for script/style, br and block closes
+BLOCK_CLOSES = (b'/p', b'/div', b'/h1', b'/h2', b'/h3', b'/h4', b'/h5', b'/h6', b'/li', b'/td', b'/tr')
+# the only members the text pipeline ever opens (container.xml, OPF, chapters)
+EPUB_MEMBER_EXTS = (".html", ".htm", ".xhtml", ".xml", ".opf")
+PART_EXT = ".part"         # output is only renamed into place once complete
+JOB_MAGIC = b"XJB1"
+CHAPTERS_MAGIC = b"CHP1"
+SLICE_MS = 150
+PARALLEL = True            # run_extraction(): inflate on the second core when there is one
+RING_CHUNK = 1024          # bytes per slot of the inflate ring
+RING_SLOTS = 2
 STATUS_HISTORY = []
 
 
@@ -66,18 +91,236 @@ def _is_numbered_html(member: str) -> tuple[bool, int]:
         return False, -1
 
 
+# -----------------------------------------------------------------
+def _check_space(uzf, member, epub_path, allow_evict=True) -> bool:
+    """
+    Room for the text of member?  Checked as each member starts: its HTML
+    size bounds its stripped text, where the whole book's HTML (markup and
+    all) would refuse books that fit.
+    """
+    need = uzf.file_size(member)
+    if storage.ensure_space(need, keep=(epub_path,), allow_evict=allow_evict):
+        return True
+    log_status(f"Not enough space: {need // 1024} KB needed, {storage.free_bytes() // 1024} KB free")
+    return False
+
+
+# -----------------------------------------------------------------
+def _guess_order(members) -> list:
+    """Fallback reading order: non-numbered HTML as found, then sorted _split_NNN."""
+    numbered = []
+    non_numbered_html = []
+    for member in members:
+        if member.endswith("/"):
+            continue  # skip dirs
+        if member.lower().endswith((".html", ".htm")):
+            is_num, num = _is_numbered_html(member)
+            if is_num:
+                numbered.append((num, member))
+            else:
+                non_numbered_html.append(member)
+    numbered.sort(key=lambda x: x[0])
+    return non_numbered_html + [m for _, m in numbered]
+
+
+# -----------------------------------------------------------------
+def _iter_tags(reader):
+    """Yield the raw bytes inside every <...> of a streamed XML member."""
+    tag = b''
+    in_tag = False
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        pos = 0
+        n = len(chunk)
+        while pos < n:
+            if in_tag:
+                end = chunk.find(b'>', pos)
+                if end == -1:
+                    tag += chunk[pos:]
+                    break
+                tag += chunk[pos:end]
+                yield tag
+                tag = b''
+                in_tag = False
+                pos = end + 1
+            else:
+                start = chunk.find(b'<', pos)
+                if start == -1:
+                    break
+                in_tag = True
+                pos = start + 1
+
+
+def _parse_tag(tag: bytes):
+    """Split raw tag bytes into (local name, {attr: value}), names lowercased."""
+    tag = tag.strip()
+    if tag.endswith(b'/'):
+        tag = tag[:-1]
+    parts = tag.split(None, 1)
+    if not parts:
+        return b'', {}
+    name = parts[0].lower()
+    if b':' in name:
+        name = name.split(b':')[-1]
+    attrs = {}
+    if len(parts) < 2:
+        return name, attrs
+    rest = parts[1]
+    i = 0
+    while True:
+        eq = rest.find(b'=', i)
+        if eq == -1:
+            break
+        key = rest[i:eq].split()
+        j = eq + 1
+        while j < len(rest) and rest[j] in (32, 9, 10, 13):
+            j += 1
+        if j >= len(rest):
+            break
+        if rest[j] in (34, 39):  # " or '
+            end = rest.find(rest[j:j + 1], j + 1)
+            if end == -1:
+                end = len(rest)
+            value = rest[j + 1:end]
+            i = end + 1
+        else:
+            end = j
+            while end < len(rest) and rest[end] not in (32, 9, 10, 13):
+                end += 1
+            value = rest[j:end]
+            i = end
+        if key:
+            k = key[-1].lower()
+            if b':' in k:
+                k = k.split(b':')[-1]
+            attrs[k] = value
+    return name, attrs
+
+
+def _resolve_href(base_dir: str, href: bytes) -> str:
+    """Resolve a manifest href relative to the OPF directory into a member name."""
+    href = href.split(b'#')[0]
+    # percent-decode (%20 etc.)
+    out = b''
+    i = 0
+    while i < len(href):
+        if href[i] == 37 and i + 2 < len(href):  # '%'
+            try:
+                out += bytes([int(href[i + 1:i + 3], 16)])
+                i += 3
+                continue
+            except ValueError:
+                pass
+        out += href[i:i + 1]
+        i += 1
+    parts = base_dir.split("/") if base_dir else []
+    for p in out.decode("utf-8").split("/"):
+        if p == "..":
+            if parts:
+                parts.pop()
+        elif p and p != ".":
+            parts.append(p)
+    return "/".join(parts)
+
+
+def _read_spine(uzf) -> list | None:
+    """
+    Return the EPUB spine as member names in reading order.
+
+    Parses META-INF/container.xml and the OPF manifest/spine through
+    uzf.get_reader() so nothing is held in RAM beyond one tag at a time.
+    Non-linear items, the nav document and guide cover/toc pages are left
+    out.  Returns None if the OPF can't be found, can't be read or yields
+    nothing, so the caller falls back to _guess_order().
+    """
+    try:
+        return _parse_spine(uzf)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        # a broken container.xml/OPF (bad UTF-8, corrupt deflate data, ...)
+        log_status(f"Spine unreadable: {e}")
+        return None
+
+
+def _parse_spine(uzf) -> list | None:
+    try:
+        reader = uzf.get_reader("META-INF/container.xml")
+    except KeyError:
+        return None
+    opf_path = None
+    try:
+        for raw in _iter_tags(reader):
+            name, attrs = _parse_tag(raw)
+            if name == b'rootfile' and b'full-path' in attrs:
+                opf_path = attrs[b'full-path'].decode("utf-8")
+                break
+    finally:
+        reader.close()
+    if not opf_path or opf_path not in uzf:
+        return None
+
+    base_dir = opf_path.rsplit("/", 1)[0] if "/" in opf_path else ""
+    manifest = {}   # id -> member name (HTML only)
+    spine = []      # idrefs in order
+    skip = []       # members to leave out (nav, cover, toc)
+    reader = uzf.get_reader(opf_path)
+    try:
+        for raw in _iter_tags(reader):
+            name, attrs = _parse_tag(raw)
+            if name == b'item':
+                media = attrs.get(b'media-type', b'')
+                href = attrs.get(b'href')
+                if not href or not (media.endswith(b'html') or media.endswith(b'html+xml')):
+                    continue
+                member = _resolve_href(base_dir, href)
+                if b'nav' in attrs.get(b'properties', b'').split():
+                    skip.append(member)
+                    continue
+                manifest[attrs.get(b'id', b'')] = member
+            elif name == b'itemref':
+                if attrs.get(b'linear', b'yes').lower() == b'no':
+                    continue
+                spine.append(attrs.get(b'idref', b''))
+            elif name == b'reference':
+                if attrs.get(b'type', b'').lower() in (b'cover', b'toc') and b'href' in attrs:
+                    skip.append(_resolve_href(base_dir, attrs[b'href']))
+    finally:
+        reader.close()
+
+    ordered = []
+    for idref in spine:
+        member = manifest.get(idref)
+        if member and member in uzf and member not in skip and member not in ordered:
+            ordered.append(member)
+    return ordered or None
+
+
 # -----------------------------------------------------------------
 class HtmlToTextStreamer:
-    """Streaming HTML to plain text converter with tag stripping, whitespace normalization, and logical separations."""
-    def __init__(self, underlying_reader):
+    """
+    Streaming HTML to plain text converter with tag stripping, whitespace normalization, and logical separations.
+
+    readinto() pulls the HTML through one input buffer (pass inbuf to share
+    it between members) and writes text straight into the caller's buffer:
+    tags are matched in a small fixed buffer, so nothing is allocated per
+    byte and only entities cost a few bytes each.
+    """
+    def __init__(self, underlying_reader, inbuf=None):
         self.reader = underlying_reader
+        self.inbuf = inbuf if inbuf is not None else memoryview(bytearray(CHUNK_SIZE))
+        self.head = 0
+        self.tail = 0
         self.in_tag = False
-        self.tag_buffer = b''
+        self.tag = bytearray(TAG_MAX)  # lower-cased start of the tag
+        self.tag_len = 0
+        self.name_len = -1             # length of the tag up to its first space
         self.in_skip = False
         self.in_entity = False
-        self.entity_buffer = b''
+        self.entity = bytearray(16)
+        self.entity_len = 0
         self.last_was_space = False
-        self.buffer = b''
+        self.pending = b''             # output that didn't fit into the last readinto()
 
         # Common entities
         self.entities = {
@@ -87,93 +330,759 @@ class HtmlToTextStreamer:
             b'quot': b'"',
             b'nbsp': b' ',
             b'apos': b"'",
+            b'mdash': '\u2014'.encode(),
+            b'ndash': '\u2013'.encode(),
+            b'hellip': '\u2026'.encode(),
+            b'lsquo': '\u2018'.encode(),
+            b'rsquo': '\u2019'.encode(),
+            b'ldquo': '\u201c'.encode(),
+            b'rdquo': '\u201d'.encode(),
+            b'laquo': '\u00ab'.encode(),
+            b'raquo': '\u00bb'.encode(),
+            b'eacute': '\u00e9'.encode(),
+            b'egrave': '\u00e8'.encode(),
+            b'agrave': '\u00e0'.encode(),
+            b'ccedil': '\u00e7'.encode(),
         }
 
-    def read(self, size=512):
-        result = b''
-        while len(result) < size:
-            if not self.buffer:
-                chunk = self.reader.read(size)
-                if not chunk:
-                    break
-                self.buffer = chunk
-
-            i = 0
-            while i < len(self.buffer) and len(result) < size:
-                byte = self.buffer[i]
-                char = bytes([byte])
-
-                if self.in_skip:
-                    if byte == ord('<'):
-                        self.in_tag = True
-                        self.tag_buffer = b''
-                    elif self.in_tag:
-                        if byte == ord('>'):
-                            self.in_tag = False
-                            tag_str = self.tag_buffer.lower()
-                            if tag_str == b'/script' or tag_str == b'/style':
-                                self.in_skip = False
-                        else:
-                            self.tag_buffer += char
+    def _decode_entity(self, entity: bytes) -> bytes:
+        """Named or numeric (&#233; / &#xE9;) entity → UTF-8 bytes."""
+        if entity.startswith(b'#'):
+            try:
+                if entity[1:2] in (b'x', b'X'):
+                    cp = int(entity[2:], 16)
                 else:
-                    if byte == ord('<'):
-                        self.in_tag = True
-                        self.tag_buffer = b''
+                    cp = int(entity[1:])
+                return b' ' if cp == 0xA0 else chr(cp).encode('utf-8')
+            except (ValueError, OverflowError):
+                return b'&' + entity + b';'
+        return self.entities.get(entity.lower(), b'&' + entity + b';')
+
+    def _starts(self, name) -> bool:
+        """Does the tag just read start with name (lower case, at most TAG_MAX bytes)?"""
+        n = len(name)
+        if self.tag_len < n:
+            return False
+        tag = self.tag
+        for k in range(n):
+            if tag[k] != name[k]:
+                return False
+        return True
+
+    def _emit(self, out, n, data) -> int:
+        """Copy data into out at n; what doesn't fit waits for the next readinto()."""
+        k = len(data)
+        room = len(out) - n
+        if k > room:
+            self.pending = data[room:]
+            data = data[:room]
+            k = room
+        out[n:n + k] = data
+        return n + k
+
+    def _end_tag(self, out, n) -> int:
+        if self.name_len < 0:
+            self.name_len = self.tag_len
+        if self.in_skip:
+            if (self.tag_len == 7 and self._starts(b'/script')) or (self.tag_len == 6 and self._starts(b'/style')):
+                self.in_skip = False
+        elif self._starts(b'script') or self._starts(b'style'):
+            self.in_skip = True
+        elif self.tag_len and self.tag[0] == 47:  # '/'
+            # Insert newlines for block closes or br
+            for name in BLOCK_CLOSES:
+                if self.name_len == len(name) and self._starts(name):
+                    n = self._emit(out, n, b'\n\n')
+                    self.last_was_space = True
+                    break
+        elif self._starts(b'br'):
+            n = self._emit(out, n, b'\n')
+            self.last_was_space = True
+        return n
+
+    def readinto(self, out) -> int:
+        """Strip HTML into out (bytearray or memoryview); returns the bytes written, 0 at the end."""
+        size = len(out)
+        n = 0
+        if self.pending:
+            pending = self.pending
+            self.pending = b''
+            n = self._emit(out, 0, pending)
+        buf = self.inbuf
+        while n < size:
+            if self.head == self.tail:
+                self.head = 0
+                self.tail = self.reader.readinto(buf) or 0
+                if not self.tail:
+                    break
+            i = self.head
+            end = self.tail
+            while i < end and n < size:
+                byte = buf[i]
+                i += 1
+                if byte == 60:  # '<'
+                    self.in_tag = True
+                    self.tag_len = 0
+                    self.name_len = -1
+                    if not self.in_skip:
                         self.last_was_space = True  # Treat tag as space separator
-                    elif self.in_tag:
-                        if byte == ord('>'):
-                            self.in_tag = False
-                            tag_str = self.tag_buffer.lower()
-                            # Check for skip start
-                            if tag_str.startswith(b'script') or tag_str.startswith(b'style'):
-                                self.in_skip = True
-                            # Insert newlines for block closes or br
-                            elif tag_str.startswith(b'/'):
-                                tag_name = tag_str[1:].split(b' ')[0]
-                                if tag_name in [b'p', b'div', b'h1', b'h2', b'h3', b'h4', b'h5', b'h6', b'li', b'td', b'tr']:
-                                    result += b'\n\n'
-                                    self.last_was_space = True
-                            elif tag_str.startswith(b'br'):
-                                result += b'\n'
-                                self.last_was_space = True
-                            self.tag_buffer = b''
-                        else:
-                            self.tag_buffer += char
+                elif self.in_tag:
+                    if byte == 62:  # '>'
+                        self.in_tag = False
+                        n = self._end_tag(out, n)
                     else:
-                        # Text content
-                        if self.in_entity:
-                            if byte == ord(';'):
-                                entity = self.entity_buffer.lower()
-                                repl = self.entities.get(entity, b'&' + self.entity_buffer + b';')
-                                if repl != b' ' or not self.last_was_space:
-                                    result += repl
-                                    self.last_was_space = (repl == b' ')
-                                self.in_entity = False
-                                self.entity_buffer = b''
-                            else:
-                                self.entity_buffer += char
-                        elif byte == ord('&'):
-                            self.in_entity = True
-                            self.entity_buffer = b''
-                        elif byte in (32, 9, 10, 13):  # space, tab, \n, \r
-                            if not self.last_was_space:
-                                result += b' '
-                                self.last_was_space = True
-                        else:
-                            result += char
-                            self.last_was_space = False
-                i += 1
-
-            self.buffer = self.buffer[i:]
+                        if byte == 32 and self.name_len < 0:
+                            self.name_len = self.tag_len
+                        if self.tag_len < TAG_MAX:
+                            self.tag[self.tag_len] = byte + 32 if 65 <= byte <= 90 else byte
+                        self.tag_len += 1
+                elif self.in_skip:
+                    pass
+                elif self.in_entity:
+                    if byte == 59:  # ';'
+                        repl = self._decode_entity(bytes(self.entity[:self.entity_len]))
+                        if repl != b' ' or not self.last_was_space:
+                            n = self._emit(out, n, repl)
+                            self.last_was_space = (repl == b' ')
+                        self.in_entity = False
+                    else:
+                        if self.entity_len == len(self.entity):
+                            self.entity.extend(bytes(len(self.entity)))
+                        self.entity[self.entity_len] = byte
+                        self.entity_len += 1
+                elif byte == 38:  # '&'
+                    self.in_entity = True
+                    self.entity_len = 0
+                elif byte in (32, 9, 10, 13):  # space, tab, \n, \r
+                    if not self.last_was_space:
+                        out[n] = 32
+                        n += 1
+                        self.last_was_space = True
+                else:
+                    out[n] = byte
+                    n += 1
+                    self.last_was_space = False
+            self.head = i
+        return n
 
-        return result
+    def read(self, size=CHUNK_SIZE) -> bytes:
+        buf = bytearray(size)
+        n = self.readinto(buf)
+        return bytes(buf) if n == size else bytes(buf[:n])
 
     def close(self):
         self.reader.close()
 
 
 # -----------------------------------------------------------------
-def run_extraction(epub_path: str) -> bool:
+class BlockWriter:
+    """Buffered output stage that only hands full BLOCK_SIZE blocks to the filesystem."""
+    def __init__(self, fp, block_size=BLOCK_SIZE):
+        self.fp = fp
+        self.block_size = block_size
+        self.buf = bytearray(block_size)
+        self.mv = memoryview(self.buf)
+        self.fill = 0
+        self.writes = 0      # number of fp.write() calls issued
+        self.bytes = 0       # bytes accepted so far (== logical output offset)
+        self.chapters = []   # output offset at the start of each member
+
+    def tell(self):
+        return self.bytes
+
+    def mark_chapter(self):
+        """Record the current output offset as the start of a chapter."""
+        self.chapters.append(self.bytes)
+
+    def write(self, data):
+        src = memoryview(data)
+        n = len(src)
+        pos = 0
+        while pos < n:
+            take = min(self.block_size - self.fill, n - pos)
+            self.mv[self.fill:self.fill + take] = src[pos:pos + take]
+            self.fill += take
+            pos += take
+            if self.fill == self.block_size:
+                self._emit()
+        self.bytes += n
+        return n
+
+    def _emit(self):
+        if self.fill:
+            self.fp.write(self.mv[:self.fill])
+            self.writes += 1
+            self.fill = 0
+
+    def flush(self):
+        """Push any partial block out (member boundaries and close)."""
+        self._emit()
+        self.fp.flush()
+
+    def close(self):
+        self.flush()
+
+
+# -----------------------------------------------------------------
+class PipeBuffers:
+    """The buffers every member passes through, allocated once per book."""
+    def __init__(self, size=CHUNK_SIZE):
+        self.zip = bytearray(INPUT_BUFFER_SIZE)           # compressed input (get_reader(), InflateRing)
+        self.html = memoryview(bytearray(size))          # inflated HTML
+        self.text = memoryview(bytearray(size))          # stripped UTF-8
+        self.glyphs = memoryview(bytearray(2 * size + 4))  # GlyphEncoder.feed_into() output
+
+    def stripper(self, uzf, member):
+        return HtmlToTextStreamer(uzf.get_reader(member, buf=self.zip), self.html)
+
+    def pump(self, stripper, encoder, writer) -> bool:
+        """Move one chunk from stripper to writer; False once the member is done."""
+        n = stripper.readinto(self.text)
+        if not n:
+            if encoder:
+                writer.write(encoder.flush())
+            return False
+        if encoder:
+            writer.write(self.glyphs[:encoder.feed_into(self.text, n, self.glyphs)])
+        else:
+            writer.write(self.text[:n])
+        return True
+
+
+# -----------------------------------------------------------------
+# slot kinds of the inflate ring
+_DATA, _END, _ERROR, _DONE = 0, 1, 2, 3
+
+
+class _Slots:
+    """
+    RING_SLOTS buffers handed from one core to the other, in order.
+
+    Every slot has two locks: free (held while the slot waits to be read)
+    and filled (held while it waits to be written).  A slot carries a
+    chunk, the end of a member or the error that ended it.
+    """
+    def __init__(self, bufs):
+        self.bufs = bufs
+        self.kind = bytearray(RING_SLOTS)
+        self.size = [0] * RING_SLOTS
+        self.error = [None] * RING_SLOTS
+        self.free = [_thread.allocate_lock() for _ in range(RING_SLOTS)]
+        self.filled = [_thread.allocate_lock() for _ in range(RING_SLOTS)]
+        for lock in self.filled:
+            lock.acquire()
+
+    def put(self, slot, kind, size=0, error=None):
+        self.kind[slot] = kind
+        self.size[slot] = size
+        self.error[slot] = error
+        self.filled[slot].release()
+
+
+def _release(*locks):
+    for lock in locks:
+        try:
+            if lock.locked():
+                lock.release()
+        except RuntimeError:
+            pass  # taken back by the other thread in between
+
+
+class _RingInput(io.IOBase):
+    """Core 1's stream of one member's compressed bytes, read from the slots core 0 fills."""
+    def __init__(self, ring):
+        self.ring = ring
+        self.slot = 0
+        self.pos = 0
+        self.have = False
+        self.ended = False
+
+    def readinto(self, b):
+        if self.ended:
+            return 0
+        r = self.ring
+        s = self.slot
+        if not self.have:
+            r.input.filled[s].acquire()
+            if r.stopping:
+                raise OSError("inflate ring stopped")
+            self.have = True
+            self.pos = 0
+        kind = r.input.kind[s]
+        if kind != _DATA:
+            self.ended = True
+            self._give_back()
+            if kind == _ERROR:
+                raise r.input.error[s]
+            return 0
+        n = min(len(b), r.input.size[s] - self.pos)
+        b[:n] = r.input.bufs[s][self.pos:self.pos + n]
+        self.pos += n
+        if self.pos == r.input.size[s]:
+            self._give_back()
+        return n
+
+    def _give_back(self):
+        self.have = False
+        self.ring.input.free[self.slot].release()
+        self.slot = (self.slot + 1) % RING_SLOTS
+        _release(self.ring.wake)
+
+    def next_member(self):
+        """Skip what the inflater left of this member's input."""
+        try:
+            while not self.ended:
+                self.readinto(self.ring.input.bufs[self.slot])
+        except Exception:
+            pass  # already passed on, or the ring is stopping
+        self.ended = False
+
+
+class InflateRing:
+    """
+    Inflate the members in order on a second thread (core 1 on the RP2040)
+    while the caller strips and writes on core 0.
+
+    Only core 0 touches the filesystem: LittleFS has no lock of its own, and
+    the caller writes the .part while the members are read.  So core 0 also
+    reads each member's compressed bytes into the input slots (carved out of
+    zipbuf), and core 1 only inflates them from RAM into the output slots.
+    Each side blocks on a full ring and on an empty one, so neither runs
+    ahead.  Core 0 tops up the input before it waits for output, and wakes
+    on the wake lock whenever core 1 frees an input slot or fills an output
+    one, since the inflater may need more input to finish a chunk.
+
+    To the stripper the ring is a reader of the current member: readinto()
+    returns 0 at its end and raises its read or inflate error, close()
+    skips what is left of it.  stop() ends the thread.
+    """
+    def __init__(self, uzf, members, zipbuf=None, chunk=RING_CHUNK):
+        self.fp = uzf.fp
+        self.entries = []      # (data start, compressed size, method, error) per member
+        for member in members:
+            try:
+                self.entries.append(uzf.raw_entry(member) + (None,))
+            except Exception as e:
+                self.entries.append((0, 0, 0, e))
+        zipbuf = memoryview(zipbuf or bytearray(INPUT_BUFFER_SIZE))
+        step = len(zipbuf) // RING_SLOTS
+        self.input = _Slots([zipbuf[i * step:(i + 1) * step] for i in range(RING_SLOTS)])
+        self.output = _Slots([memoryview(bytearray(chunk)) for _ in range(RING_SLOTS)])
+        self.feeding = 0       # member core 0 is reading
+        self.fed = 0           # bytes of it already read
+        self.in_slot = 0
+        self.wake = _thread.allocate_lock()   # released by core 1 on progress
+        self.wake.acquire()
+        self.running = _thread.allocate_lock()
+        self.running.acquire()
+        self.stopping = False
+        self.slot = 0          # the reader's output slot
+        self.pos = 0           # bytes of it already read
+        self.have = False      # its filled lock is taken
+        _thread.start_new_thread(self._run, ())
+
+    # ---------------------------------------------- inflating thread
+    def _run(self):
+        out = self.output
+        inp = _RingInput(self)
+        slot = 0
+        try:
+            for _, _, method, missing in self.entries:
+                reader = None
+                kind = _DATA
+                while kind == _DATA:
+                    out.free[slot].acquire()
+                    if self.stopping:
+                        return
+                    error = None
+                    try:
+                        if missing:
+                            raise missing
+                        if reader is None:
+                            reader = (deflate.DeflateIO(inp, deflate.RAW, WBITS) if method == 8
+                                      else inp if method == 0 else None)
+                            if reader is None:
+                                raise NotImplementedError("compression method not supported")
+                        n = reader.readinto(out.bufs[slot])
+                        kind = _DATA if n else _END
+                    except Exception as e:
+                        n, kind, error = 0, _ERROR, e
+                    out.put(slot, kind, n, error)
+                    _release(self.wake)
+                    slot = (slot + 1) % RING_SLOTS
+                if self.stopping:
+                    return
+                if missing is None:
+                    inp.next_member()
+            out.free[slot].acquire()
+            out.put(slot, _DONE)
+            _release(self.wake)
+        finally:
+            self.running.release()
+
+    # ---------------------------------------------- feeding (core 0)
+    def _feed(self) -> bool:
+        """Read the next compressed chunk into a free input slot; False if there is no room or nothing left."""
+        entries = self.entries
+        while self.feeding < len(entries) and entries[self.feeding][3] is not None:
+            self.feeding += 1      # missing: the inflater raises its error without input
+        if self.feeding >= len(entries):
+            return False
+        s = self.in_slot
+        if not self.input.free[s].acquire(0):
+            return False
+        start, size, _, error = entries[self.feeding]
+        kind, n = _DATA, 0
+        if self.fed >= size:
+            kind = _END
+        else:
+            try:
+                self.fp.seek(start + self.fed)
+                buf = self.input.bufs[s]
+                n = self.fp.readinto(buf[:min(len(buf), size - self.fed)]) or 0
+                if not n:
+                    raise OSError("member truncated")
+                self.fed += n
+            except Exception as e:
+                kind, n, error = _ERROR, 0, e
+        if kind != _DATA:
+            self.feeding += 1
+            self.fed = 0
+        self.input.put(s, kind, n, error)
+        self.in_slot = (s + 1) % RING_SLOTS
+        return True
+
+    # ---------------------------------------------- reader side
+    def _take(self):
+        if not self.have:
+            while not self.output.filled[self.slot].acquire(0):
+                if not self._feed():
+                    self.wake.acquire()   # until core 1 takes input or gives output
+            self.have = True
+            self.pos = 0
+        return self.slot
+
+    def _give_back(self):
+        self.have = False
+        self.output.free[self.slot].release()
+        self.slot = (self.slot + 1) % RING_SLOTS
+
+    def readinto(self, b):
+        s = self._take()
+        out = self.output
+        kind = out.kind[s]
+        if kind == _ERROR:
+            raise out.error[s]
+        if kind != _DATA:
+            return 0
+        n = min(len(b), out.size[s] - self.pos)
+        b[:n] = out.bufs[s][self.pos:self.pos + n]
+        self.pos += n
+        if self.pos == out.size[s]:
+            self._give_back()
+        return n
+
+    def close(self):
+        """Skip to the next member (the stripper closes its reader after each one)."""
+        while True:
+            kind = self.output.kind[self._take()]
+            if kind == _DONE:
+                return
+            self._give_back()
+            if kind != _DATA:
+                return
+
+    def stop(self):
+        """End the inflating thread, wherever it is, and wait for it."""
+        self.stopping = True
+        while not self.running.acquire(0):
+            _release(*self.output.free)
+            _release(*self.input.filled)
+            time.sleep_ms(1)
+
+
+def _start_ring(uzf, members, bufs):
+    """An InflateRing, or None to inflate on this core (no _thread, or core 1 busy)."""
+    if not PARALLEL or _thread is None:
+        return None
+    try:
+        return InflateRing(uzf, members, bufs.zip)
+    except Exception as e:
+        log_status(f"Inflating on one core: {e}")
+        return None
+
+
+@memstat.measured("extract_member")
+def _stream_member(uzf, member, writer, glyph=True, bufs=None, ring=None):
+    """Inflate one member (or take it from ring), strip its HTML and push the text through writer."""
+    bufs = bufs or PipeBuffers()
+    stripper = HtmlToTextStreamer(ring, bufs.html) if ring else bufs.stripper(uzf, member)
+    encoder = glyphtext.GlyphEncoder() if glyph else None
+    writer.mark_chapter()
+    try:
+        while bufs.pump(stripper, encoder, writer):
+            pass
+    finally:
+        stripper.close()
+    writer.flush()
+
+
+# -----------------------------------------------------------------
+def convert_txt(txt_path: str) -> str | None:
+    """
+    Convert a UTF-8 .txt book into glyph text (.gtx) next to it.
+
+    Returns the output path, or None on failure.
+    """
+    out_path = txt_path.rsplit(".", 1)[0] + glyphtext.EXT
+    log_status(f"Converting: {txt_path}")
+    try:
+        with open(txt_path, "rb") as src, open(out_path, "wb") as out:
+            writer = BlockWriter(out)
+            encoder = glyphtext.GlyphEncoder()
+            while True:
+                chunk = src.read(BLOCK_SIZE)
+                if not chunk:
+                    break
+                writer.write(encoder.feed(chunk))
+            writer.write(encoder.flush())
+            writer.close()
+        log_status(f"Wrote {writer.bytes} bytes → {out_path}")
+        return out_path
+    except Exception as e:
+        log_status(f"Convert failed: {e}")
+        return None
+
+
+# -----------------------------------------------------------------
+def save_chapters(path: str, starts) -> bool:
+    """
+    Write a chapter table: "CHP1", u32 count, then a u32 per chapter
+    (the offset where it starts, or its first page for a .pgb).
+    """
+    try:
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sI", CHAPTERS_MAGIC, len(starts)))
+            for off in starts:
+                f.write(struct.pack("<I", off))
+        return True
+    except Exception as e:
+        log_status(f"Chapter table failed: {e}")
+        return False
+
+
+def load_chapters(path: str) -> list | None:
+    try:
+        with open(path, "rb") as f:
+            magic, n = struct.unpack("<4sI", f.read(8))
+            if magic != CHAPTERS_MAGIC:
+                return None
+            return list(struct.unpack(f"<{n}I", f.read(4 * n)))
+    except OSError:
+        return None
+
+
+# -----------------------------------------------------------------
+def _truncate_copy(path: str, length: int) -> None:
+    """Cut path down to length bytes (MicroPython files have no truncate())."""
+    tmp = path + ".tmp"
+    with open(path, "rb") as src, open(tmp, "wb") as dst:
+        left = length
+        while left > 0:
+            chunk = src.read(min(BLOCK_SIZE, left))
+            if not chunk:
+                break
+            dst.write(chunk)
+            left -= len(chunk)
+    os.remove(path)
+    os.rename(tmp, path)
+
+
+class ExtractionJob:
+    """
+    Resumable, time-sliced EPUB → .gtx conversion.
+
+    step() converts for at most budget_ms (or until stop() returns True)
+    and returns True once the job is over.  After every finished member (member count, output length)
+    is written to state_file, so after a reset, sleep or flat battery the
+    job picks up at the last finished member.  Output goes to a .part file
+    that is renamed into place only when every member converted; a member
+    that fails ends the job (ok False) with the .part and checkpoint left
+    at the member before it.
+
+    The output is exactly what EpubStream produces, so a reader can
+    switch from the EPUB to the .gtx without losing its page index.
+    """
+    def __init__(self, epub_path: str, out_path: str = None, state_file: str = None,
+                 allow_evict: bool = True):
+        self.epub_path = epub_path
+        self.allow_evict = allow_evict  # may evict other books' caches to make room
+        self.out_path = out_path or epub_path.rsplit(".", 1)[0] + glyphtext.EXT
+        self.part_path = self.out_path + PART_EXT
+        self.state_file = state_file
+        self.uzf = None
+        self.members = []
+        self.next_member = 0
+        self.out = None
+        self.writer = None
+        self.stripper = None
+        self.encoder = None
+        self.bufs = None
+        self.done = False
+        self.ok = True
+        self.no_space = False    # stopped (checkpointed) because the flash is full
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.state_file, "rb") as f:
+                magic, n_members, done, length = struct.unpack("<4sHHI", f.read(12))
+            if magic == JOB_MAGIC and n_members == len(self.members):
+                return done, length
+        except Exception:
+            pass
+        return 0, 0
+
+    def _save_checkpoint(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "wb") as f:
+                f.write(struct.pack("<4sHHI", JOB_MAGIC, len(self.members),
+                                    self.next_member, self.writer.tell()))
+        except Exception as e:
+            log_status(f"Checkpoint failed: {e}")
+
+    def _open(self):
+        self.uzf = UZipFile(self.epub_path, exts=EPUB_MEMBER_EXTS)
+        self.members = _read_spine(self.uzf) or _guess_order(self.uzf.namelist())
+        done, length = self._load_checkpoint() if self.state_file else (0, 0)
+        try:
+            size = os.stat(self.part_path)[6]
+        except OSError:
+            size = -1
+        if not (done and size >= length):
+            done, length = 0, 0
+        if done:
+            if size > length:
+                _truncate_copy(self.part_path, length)
+            self.out = open(self.part_path, "ab")
+            log_status(f"Resuming at member {done + 1}/{len(self.members)}")
+        else:
+            self.out = open(self.part_path, "wb")
+        self.writer = BlockWriter(self.out)
+        self.writer.bytes = length
+        self.next_member = done
+        self.bufs = PipeBuffers()
+
+    def step(self, budget_ms: int = SLICE_MS, stop=None) -> bool:
+        if self.done:
+            return True
+        deadline = time.ticks_add(time.ticks_ms(), budget_ms)
+        if self.uzf is None:
+            try:
+                self._open()
+            except Exception as e:
+                log_status(f"Job failed: {e}")
+                self.suspend()
+                self.ok = False
+                self.done = True
+                return True
+        while True:
+            if self.stripper is None:
+                if self.next_member >= len(self.members):
+                    return self._finish()
+                member = self.members[self.next_member]
+                if not _check_space(self.uzf, member, self.epub_path, self.allow_evict):
+                    # finished members stay checkpointed for a later try
+                    self.suspend()
+                    self.no_space = True
+                    self.ok = False
+                    self.done = True
+                    return True
+                log_status(f"[{self.next_member + 1}/{len(self.members)}] (job) …{member[-20:]}")
+                try:
+                    self.stripper = self.bufs.stripper(self.uzf, member)
+                except Exception as e:
+                    return self._fail(e)
+                self.encoder = glyphtext.GlyphEncoder()
+                self.writer.mark_chapter()
+                memstat.begin("extract_member")
+            try:
+                if not self.bufs.pump(self.stripper, self.encoder, self.writer):
+                    self._end_member()
+                    self._save_checkpoint()
+            except Exception as e:
+                memstat.end("extract_member")
+                return self._fail(e)
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0 or (stop and stop()):
+                return False
+
+    def _fail(self, e):
+        """A member can't be converted: stop short of it, so the book is never renamed into place."""
+        log_status(f"Failed {self.members[self.next_member]}: {e}")
+        if self.stripper:
+            try:
+                self.stripper.close()
+            except Exception:
+                pass
+            self.stripper = None
+        # the .part and .job stay at the last finished member for a later try
+        self.suspend()
+        self.ok = False
+        self.done = True
+        return True
+
+    def _end_member(self):
+        memstat.end("extract_member")
+        if self.stripper:
+            try:
+                self.stripper.close()
+            except Exception:
+                pass
+            self.stripper = None
+        self.writer.flush()
+        self.next_member += 1
+
+    def _finish(self):
+        self.done = True
+        try:
+            self.writer.close()
+            self.out.close()
+            self.out = None
+            self.uzf.close()
+            self.uzf = None
+            self.bufs = None
+            os.rename(self.part_path, self.out_path)
+        except Exception as e:
+            log_status(f"Job failed: {e}")
+            self.ok = False
+            return True
+        if self.state_file:
+            try:
+                os.remove(self.state_file)
+            except OSError:
+                pass
+        log_status(f"Job complete → {self.out_path}")
+        return True
+
+    def suspend(self):
+        """Release files; the last finished member stays checkpointed."""
+        if self.stripper:
+            self.stripper.close()
+            self.stripper = None
+        if self.out:
+            self.writer.flush()
+            self.out.close()
+            self.out = None
+        if self.uzf:
+            self.uzf.close()
+            self.uzf = None
+        self.bufs = None
+
+
+# -----------------------------------------------------------------
+def run_extraction(epub_path: str, glyph: bool = True, layout=None, compress: bool = False,
+                   chapters_path: str | None = None) -> bool:
     """
     Extract EPUB to text file in TARGET_DIR.
     
@@ -181,6 +1090,12 @@ def run_extraction(epub_path: str) -> bool:
         epub_path: Can be either:
                    - Full path like "/books/Sway.epub"
                    - Just filename like "Sway.epub" (will look in TARGET_DIR)
+        glyph: write glyph-coded text (.gtx) instead of UTF-8 (.txt)
+        layout: (max_chars, lines_per_page) to write a pre-paginated
+                .pgb in the same pass (implies glyph)
+        compress: store the output as independently deflated 4 KB blocks
+                  (see blockzip.py); ignored if the firmware can't compress
+        chapters_path: also write the chapter table there (save_chapters())
     
     Returns:
         True if successful, False otherwise
@@ -208,79 +1123,73 @@ def run_extraction(epub_path: str) -> bool:
 
     time.sleep(0.5)
 
+    if compress and not blockzip.can_compress():
+        log_status("deflate can't compress here, storing plain")
+        compress = False
+
     success = True
     try:
-        with UZipFile(epub_full_path) as uzf:
-            all_members = uzf.namelist()
-            # Only include HTML files
-            numbered = []
-            non_numbered_html = []
-            for member in all_members:
-                if member.endswith("/"):
-                    continue  # skip dirs
-                if member.lower().endswith((".html", ".htm")):
-                    is_num, num = _is_numbered_html(member)
-                    if is_num:
-                        numbered.append((num, member))
-                    else:
-                        non_numbered_html.append(member)
+        with UZipFile(epub_full_path, exts=EPUB_MEMBER_EXTS) as uzf:
+            ordered = _read_spine(uzf)
+            if ordered:
+                log_status("Using OPF spine order")
+            else:
+                log_status("No usable OPF spine, guessing order")
+                ordered = _guess_order(uzf.namelist())
 
-            total = len(non_numbered_html) + len(numbered)
+            total = len(ordered)
             log_status(f"Files to process: {total}")
 
-            # Sort numbered by num
-            numbered.sort(key=lambda x: x[0])
-
             extracted_count = 0
 
             # Output path - always in TARGET_DIR
-            concat_path = f"/{TARGET_DIR}/{base_name}.txt"
+            if layout:
+                glyph = True
+                ext = pagebook.EXT
+            else:
+                ext = glyphtext.EXT if glyph else ".txt"
+            concat_path = f"/{TARGET_DIR}/{base_name}{ext}"
             
-            has_combined = non_numbered_html or numbered
+            has_combined = bool(ordered)
             if has_combined:
                 try:
-                    with open(concat_path, "wb") as out:
-                        # First, non-numbered HTML in order encountered
-                        for j, member in enumerate(non_numbered_html, 1):
-                            disp = member[-20:]
-                            log_status(f"[{j}/{total}] (stream) …{disp}")
-
-                            try:
-                                reader = uzf.get_reader(member)
-                                stripper = HtmlToTextStreamer(reader)
-                                while True:
-                                    chunk = stripper.read(512)
-                                    if not chunk:
-                                        break
-                                    out.write(chunk)
-                                stripper.close()
-                                extracted_count += 1
-                            except Exception as e:
-                                log_status(f"Failed {member}: {e}")
-                                success = False
-
-                        # Then, sorted numbered HTML
-                        for k, (num, member) in enumerate(numbered, 1):
-                            idx = len(non_numbered_html) + k
-                            disp = member[-20:]
-                            log_status(f"[{idx}/{total}] (stream) …{disp}")
-
-                            try:
-                                reader = uzf.get_reader(member)
-                                stripper = HtmlToTextStreamer(reader)
-                                while True:
-                                    chunk = stripper.read(512)
-                                    if not chunk:
-                                        break
-                                    out.write(chunk)
-                                stripper.close()
-                                extracted_count += 1
-                            except Exception as e:
-                                log_status(f"Failed {member}: {e}")
-                                success = False
+                    with open(concat_path + PART_EXT, "wb") as out:
+                        block = BlockWriter(out)
+                        writer = blockzip.BlockZipWriter(block) if compress else block
+                        if layout:
+                            writer = pagebook.PageWriter(writer, layout[0], layout[1])
+                        bufs = PipeBuffers()
+                        ring = _start_ring(uzf, ordered, bufs)
+                        try:
+                            for j, member in enumerate(ordered, 1):
+                                disp = member[-20:]
+                                log_status(f"[{j}/{total}] (stream) …{disp}")
+                                if not _check_space(uzf, member, epub_full_path):
+                                    raise OSError("not enough space")
+
+                                try:
+                                    _stream_member(uzf, member, writer, glyph, bufs, ring)
+                                    extracted_count += 1
+                                except Exception as e:
+                                    log_status(f"Failed {member}: {e}")
+                                    raise  # a book with a hole in it is not renamed into place
+                        finally:
+                            if ring:
+                                ring.stop()
+                        writer.close()
+                        log_status(f"Wrote {writer.tell()} bytes ({block.bytes} on flash) in {block.writes} writes")
+                        if chapters_path:
+                            save_chapters(chapters_path, writer.chapters)
+                    # only a finished book gets the real name
+                    os.rename(concat_path + PART_EXT, concat_path)
                 except Exception as e:
                     log_status(f"Concat failed: {e}")
                     success = False
+                    # an unfinished .part is no use to anyone, give its space back
+                    try:
+                        os.remove(concat_path + PART_EXT)
+                    except OSError:
+                        pass
 
             log_status("--- EXTRACTION COMPLETE ---")
             if has_combined:
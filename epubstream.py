@@ -0,0 +1,215 @@
+# ------------------------------------------------------------
+# epubstream.py  –  read an EPUB as glyph text without extracting it
+# ------------------------------------------------------------
+# EpubStream chains the spine members through UZipFile.get_reader(),
+# HtmlToTextStreamer and GlyphEncoder, which is exactly the pipeline
+# run_extraction() writes to a .gtx, so byte offsets (and page indexes)
+# are interchangeable with the extracted book.
+#
+# DEFLATE can't be restarted mid-stream without its 32 KB window, so the
+# restartable checkpoints are member starts: (member index, output
+# offset), with a fresh stripper.  They are learnt while reading and kept
+# in /state with the book's fingerprint (another edition of the book with
+# as many members must not reuse them), so a seek replays at most one member.  A short window of
+# already decoded text makes small backward seeks (previous page) free.
+import struct
+from array import array
+import glyphtext
+from epub_xtract import CHUNK_SIZE, EPUB_MEMBER_EXTS, HtmlToTextStreamer, _guess_order, _read_spine
+from uzipfile import UZipFile
+
+CHECKPOINT_MAGIC = b"ECK2"
+CHECKPOINT_HEADER_FMT = "<4sHHII"   # magic, members, starts, book size, book hash
+CHECKPOINT_HEADER_SIZE = 16
+BACK_WINDOW = 4096     # decoded bytes kept behind the read position
+
+
+class EpubStream:
+    """Seekable, read-only glyph text view of an EPUB with seek(), tell(), read() and readline()."""
+    def __init__(self, path, checkpoint_file=None, fingerprint=(0, 0)):
+        self.uzf = UZipFile(path, exts=EPUB_MEMBER_EXTS)
+        self.members = _read_spine(self.uzf) or _guess_order(self.uzf.namelist())
+        self.raw_sizes = array("I", [self.uzf.file_size(m) for m in self.members])
+        self.checkpoint_file = checkpoint_file
+        self.fingerprint = fingerprint  # (size, hash) of the EPUB, as main.book_fingerprint()
+        self.starts = array("I", [0])   # output offset of member i; one extra entry == total size
+        self.dirty = False
+        self.pos = 0
+        self.win = b''                  # decoded text from win_start up to out
+        self.win_start = 0
+        self.out = 0
+        self.member = -1
+        self.stripper = None
+        self.encoder = None
+        self._load_checkpoints()
+        self._restart(0)
+
+    # -----------------------------------------------------------------
+    def _load_checkpoints(self):
+        if not self.checkpoint_file:
+            return
+        try:
+            with open(self.checkpoint_file, "rb") as f:
+                magic, n_members, n, size, h = struct.unpack(CHECKPOINT_HEADER_FMT,
+                                                             f.read(CHECKPOINT_HEADER_SIZE))
+                if (magic == CHECKPOINT_MAGIC and n_members == len(self.members)
+                        and (size, h) == tuple(self.fingerprint)):
+                    self.starts = array("I", f.read(4 * n))
+        except OSError:
+            pass
+        except Exception as e:
+            print("checkpoint load failed:", e)
+
+    def save_checkpoints(self):
+        if not self.checkpoint_file or not self.dirty:
+            return
+        try:
+            with open(self.checkpoint_file, "wb") as f:
+                f.write(struct.pack(CHECKPOINT_HEADER_FMT, CHECKPOINT_MAGIC, len(self.members),
+                                    len(self.starts), *self.fingerprint))
+                f.write(self.starts)
+            self.dirty = False
+        except Exception as e:
+            print("checkpoint save failed:", e)
+
+    # -----------------------------------------------------------------
+    @property
+    def complete(self):
+        return len(self.starts) > len(self.members)
+
+    @property
+    def size(self):
+        """Exact once every member has been seen, otherwise an estimate for the progress bar."""
+        known = len(self.starts) - 1
+        if known >= len(self.members):
+            return self.starts[-1]
+        raw_done = sum(self.raw_sizes[:known])
+        raw_left = sum(self.raw_sizes[known:])
+        ratio = self.starts[-1] / raw_done if raw_done else 0.5
+        return max(self.out, self.starts[-1] + int(raw_left * ratio))
+
+    # -----------------------------------------------------------------
+    def _restart(self, m):
+        """Start decoding member m from its checkpoint."""
+        if self.stripper:
+            self.stripper.close()
+            self.stripper = None
+        self.member = m
+        self.out = self.starts[m]
+        self.win = b''
+        self.win_start = self.out
+        if m < len(self.members):
+            self._open_member(m)
+
+    def _open_member(self, m):
+        try:
+            self.stripper = HtmlToTextStreamer(self.uzf.get_reader(self.members[m]))
+            self.encoder = glyphtext.GlyphEncoder()
+        except Exception as e:
+            print(f"[EPUBSTREAM] {self.members[m]}: {e}")
+            self.stripper = None
+            self._next_member()
+
+    def _next_member(self):
+        if self.stripper:
+            self.stripper.close()
+            self.stripper = None
+        m = self.member + 1
+        if m == len(self.starts):
+            self.starts.append(self.out)
+            self.dirty = True
+        self.member = m
+        if m < len(self.members):
+            self._open_member(m)
+
+    def _pump(self):
+        """Decode the next chunk into the window. False at the end of the book."""
+        while self.stripper:
+            chunk = self.stripper.read(CHUNK_SIZE)
+            if chunk:
+                data = self.encoder.feed(chunk)
+            else:
+                data = self.encoder.flush()
+                self._next_member()
+            if data:
+                self.win += data
+                self.out += len(data)
+                return True
+        return False
+
+    def _trim(self, keep_from):
+        drop = min(keep_from - BACK_WINDOW, self.out) - self.win_start
+        if drop > CHUNK_SIZE:
+            self.win = self.win[drop:]
+            self.win_start += drop
+
+    def _goto(self, pos):
+        """Position decoding so that pos is inside (or at the end of) the window."""
+        if self.win_start <= pos <= self.out:
+            return
+        # last member whose start is known and not after pos
+        m = len(self.starts) - 1
+        while m > 0 and self.starts[m] > pos:
+            m -= 1
+        m = min(m, len(self.members) - 1) if self.members else 0
+        if pos < self.win_start or m > self.member:
+            self._restart(m)
+        while self.out < pos and self._pump():
+            self._trim(pos)
+
+    # -----------------------------------------------------------------
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            self._goto(self.out)
+            while self._pump():
+                self._trim(self.out)
+            offset += self.out
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        self._goto(self.pos)
+        while (size < 0 or self.out < self.pos + size) and self._pump():
+            pass
+        start = self.pos - self.win_start
+        end = len(self.win) if size < 0 else start + size
+        data = self.win[start:end]
+        self.pos += len(data)
+        self._trim(self.pos)
+        return data
+
+    def readline(self):
+        self._goto(self.pos)
+        start = self.pos - self.win_start
+        scan = start
+        while True:
+            nl = self.win.find(b"\n", scan)
+            if nl != -1:
+                end = nl + 1
+                break
+            scan = len(self.win)
+            if not self._pump():
+                end = len(self.win)
+                break
+        data = self.win[start:end]
+        self.pos += len(data)
+        self._trim(self.pos)
+        return data
+
+    def close(self):
+        self.save_checkpoints()
+        if self.stripper:
+            self.stripper.close()
+            self.stripper = None
+        self.uzf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,171 @@
+# ------------------------------------------------------------
+# fontfile.py  –  raw binary bitmap fonts (.bin) for the renderer
+# ------------------------------------------------------------
+# Layout:
+#   header   "BFN1", u8 width, u8 height, u8 first, u8 last, u16 flags
+#   advances (FLAG_PROPORTIONAL only) u8 advance width of every glyph
+#   glyphs   (last - first + 1) glyphs, height rows of ceil(width / 8)
+#            bytes each, MSB = leftmost pixel (same as vga2_8x16.FONT);
+#            in a proportional font glyphs are left-aligned in the cell
+# A Font either reads every glyph into one preallocated buffer with a
+# single readinto(), or (lazy=True) pages blocks of GLYPHS_PER_BLOCK
+# glyphs in from flash on demand and keeps the last few in a small LRU.
+import struct
+
+MAGIC = b"BFN1"
+HEADER_FMT = "<4sBBBBH"
+HEADER_SIZE = 10
+FLAG_PROPORTIONAL = 0x0001
+GLYPHS_PER_BLOCK = 16
+CACHE_BLOCKS = 8
+FALLBACK_GLYPH = 63   # '?'
+
+
+class Font:
+    """Bitmap font from a BFN1 file (path) or from a font module like vga2_8x16 (module)."""
+    def __init__(self, path=None, lazy=False, cache_blocks=CACHE_BLOCKS, module=None):
+        self.path = path
+        self.fp = None
+        self.FONT = None
+        if module is not None:
+            self.WIDTH, self.HEIGHT = module.WIDTH, module.HEIGHT
+            self.FIRST, self.LAST = module.FIRST, module.LAST
+            self.flags = 0
+            self.FONT = module.FONT
+        else:
+            f = open(path, "rb")
+            magic, self.WIDTH, self.HEIGHT, self.FIRST, self.LAST, self.flags = \
+                struct.unpack(HEADER_FMT, f.read(HEADER_SIZE))
+            if magic != MAGIC:
+                f.close()
+                raise OSError("Not a BFN1 font: " + path)
+        self.row_bytes = (self.WIDTH + 7) // 8
+        self.glyph_size = self.row_bytes * self.HEIGHT
+        self.data_start = HEADER_SIZE
+        self.advance = None      # per-code advance widths, None when monospaced
+        if module is not None:
+            return
+        if self.flags & FLAG_PROPORTIONAL:
+            n = self.LAST - self.FIRST + 1
+            adv = bytearray([0] * 256)
+            table = f.read(n)
+            for i in range(256):
+                g = i if self.FIRST <= i <= self.LAST else FALLBACK_GLYPH
+                adv[i] = table[g - self.FIRST]
+            self.advance = bytes(adv)
+            self.data_start += n
+        if lazy:
+            self.fp = f
+            self.cache_blocks = cache_blocks
+            self.cache = {}    # block index -> bytes
+            self.order = []    # most recently used last
+        else:
+            buf = bytearray(self.glyph_size * (self.LAST - self.FIRST + 1))
+            f.seek(self.data_start)
+            f.readinto(buf)
+            f.close()
+            self.FONT = memoryview(buf)
+
+    def _block(self, b):
+        data = self.cache.get(b)
+        if data is not None:
+            self.order.remove(b)
+            self.order.append(b)
+            return data
+        size = self.glyph_size * GLYPHS_PER_BLOCK
+        self.fp.seek(self.data_start + b * size)
+        data = self.fp.read(size)
+        if len(self.order) >= self.cache_blocks:
+            del self.cache[self.order.pop(0)]
+        self.cache[b] = data
+        self.order.append(b)
+        return data
+
+    def glyph(self, g):
+        """Rows of glyph g (row_bytes per row); unknown glyphs draw as '?'."""
+        if g < self.FIRST or g > self.LAST:
+            g = FALLBACK_GLYPH
+        i = g - self.FIRST
+        gs = self.glyph_size
+        if self.FONT is not None:
+            return self.FONT[i * gs:(i + 1) * gs]
+        b, k = divmod(i, GLYPHS_PER_BLOCK)
+        return memoryview(self._block(b))[k * gs:(k + 1) * gs]
+
+    def width_of(self, g):
+        """Advance width in pixels of glyph code g."""
+        if self.advance is None:
+            return self.WIDTH
+        return self.advance[g if g < 256 else FALLBACK_GLYPH]
+
+    def measure(self, text):
+        """Pixel width of glyph bytes (or a str, one glyph per character)."""
+        if self.advance is None:
+            return len(text) * self.WIDTH
+        adv = self.advance
+        px = 0
+        if isinstance(text, str):
+            for c in text:
+                o = ord(c)
+                px += adv[o if o < 256 else FALLBACK_GLYPH]
+        else:
+            for g in text:
+                px += adv[g]
+        return px
+
+    def close(self):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+
+
+def save_font(path, module):
+    """Write a font module (WIDTH, HEIGHT, FIRST, LAST, FONT) as a BFN1 file."""
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FMT, MAGIC, module.WIDTH, module.HEIGHT,
+                            module.FIRST, module.LAST, 0))
+        f.write(module.FONT)
+
+
+def save_proportional(path, module, space=4, gap=1, fixed=range(0xB0, 0xE0)):
+    """
+    Write a proportional BFN1 font derived from a monospaced font module.
+
+    Every glyph is shifted left to its first inked column and advances by
+    its inked width plus gap; glyphs in fixed (box drawing by default)
+    keep the full cell so they still join up.
+    """
+    rb = (module.WIDTH + 7) // 8
+    top = rb * 8 - 1
+    n = module.LAST - module.FIRST + 1
+    gsize = rb * module.HEIGHT
+    advances = bytearray(n)
+    glyphs = bytearray(module.FONT)
+    for i in range(n):
+        g = module.FIRST + i
+        rows = [int.from_bytes(bytes(module.FONT[(i * module.HEIGHT + r) * rb:(i * module.HEIGHT + r + 1) * rb]), "big")
+                for r in range(module.HEIGHT)]
+        ink = 0
+        for row in rows:
+            ink |= row
+        if g in fixed:
+            advances[i] = module.WIDTH
+            continue
+        if not ink:
+            advances[i] = space
+            continue
+        left = 0
+        while not (ink >> (top - left)) & 1:
+            left += 1
+        right = module.WIDTH - 1
+        while not (ink >> (top - right)) & 1:
+            right -= 1
+        advances[i] = min(module.WIDTH, right - left + 1 + gap)
+        for r, row in enumerate(rows):
+            start = i * gsize + r * rb
+            glyphs[start:start + rb] = ((row << left) & ((1 << (rb * 8)) - 1)).to_bytes(rb, "big")
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FMT, MAGIC, module.WIDTH, module.HEIGHT,
+                            module.FIRST, module.LAST, FLAG_PROPORTIONAL))
+        f.write(advances)
+        f.write(glyphs)
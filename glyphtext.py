@@ -0,0 +1,172 @@
+# ------------------------------------------------------------
+# glyphtext.py  –  UTF-8 → single-byte glyph text for vga2_8x16
+# ------------------------------------------------------------
+# A ".gtx" book is plain text where every byte is a glyph index into
+# vga2_8x16.FONT (code page 437).  Typography folding and the Unicode
+# lookup happen once, at conversion time, so the renderer can draw file
+# bytes directly and byte offsets equal column counts.
+
+EXT = ".gtx"
+
+# Unicode characters for glyphs 0x80..0xFF of the VGA (CP437) font
+_HIGH = (
+    "ÇüéâäàåçêëèïîìÄÅ"
+    "ÉæÆôöòûùÿÖÜ¢£¥₧ƒ"
+    "áíóúñÑªº¿⌐¬½¼¡«»"
+    "░▒▓│┤╡╢╖╕╣║╗╝╜╛┐"
+    "└┴┬├─┼╞╟╚╔╩╦╠═╬╧"
+    "╨╤╥╙╘╒╓╫╪┘┌█▄▌▐▀"
+    "αßΓπΣσµτΦΘΩδ∞φε∩"
+    "≡±≥≤⌠⌡÷≈°∙·√ⁿ²■ "
+)
+
+# Characters the font lacks, folded to something it has
+FOLD = {
+    "‘": "'", "’": "'", "‚": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "″": '"',
+    "‐": "-", "‑": "-", "‒": "-", "–": "-",
+    "—": "-", "―": "-", "−": "-",
+    "…": "...", "•": "∙",
+    "\u00a0": " ", "\u2009": " ", "\u200a": " ", "\u202f": " ",
+    "\u00ad": "", "\u200b": "", "\ufeff": "",
+    "À": "A", "Á": "A", "Â": "A", "Ã": "A", "È": "E", "Ê": "E",
+    "Ë": "E", "Ì": "I", "Í": "I", "Î": "I", "Ï": "I", "Ò": "O",
+    "Ó": "O", "Ô": "O", "Õ": "O", "Ù": "U", "Ú": "U", "Û": "U",
+    "ã": "a", "õ": "o", "œ": "oe", "Œ": "OE", "ý": "y", "Ý": "Y",
+    "©": "(c)", "®": "(R)", "™": "TM", "×": "x",
+}
+
+UNKNOWN = b"?"
+
+_MAP = {}
+for _i, _c in enumerate(_HIGH):
+    _MAP[_c] = bytes([0x80 + _i])
+for _c, _f in FOLD.items():
+    _MAP[_c] = b"".join(_MAP.get(ch) or ch.encode("utf-8") for ch in _f)
+_MAP["\t"] = b" "
+_MAP["\r"] = b""
+# the same by code point, for GlyphEncoder.feed_into()
+_CODE = {}
+for _c, _g in _MAP.items():
+    _CODE[ord(_c)] = _g
+
+
+def _seq_len(lead) -> int:
+    return 2 if lead < 0xE0 else (3 if lead < 0xF0 else 4)
+
+
+def encode(text: str) -> bytes:
+    """Map a str onto glyph bytes; characters the font can't show become '?'."""
+    out = bytearray()
+    for c in text:
+        g = _MAP.get(c)
+        if g is not None:
+            out.extend(g)
+        elif ord(c) < 128:
+            out.append(ord(c))
+        else:
+            out.extend(UNKNOWN)
+    return bytes(out)
+
+
+def _is_ascii(data) -> bool:
+    for b in data:
+        if b > 127 or b == 9 or b == 13:
+            return False
+    return True
+
+
+class GlyphEncoder:
+    """
+    Streaming UTF-8 → glyph encoder; keeps split multi-byte sequences
+    between chunks.  feed_into() writes into the caller's buffer and
+    allocates nothing; feed() returns new bytes.
+    """
+    def __init__(self):
+        self.held = bytearray(4)      # sequence split at the end of the last chunk
+        self.held_n = 0
+
+    def feed_into(self, data, n, out) -> int:
+        """
+        Encode the first n bytes of data into out; returns the bytes written.
+        out needs room for 2 * n + 4: no character grows by more than half.
+        """
+        return self._feed(data, 0, n, out, 0)
+
+    def _feed(self, data, i, n, out, m):
+        if self.held_n:
+            kept = self.held_n        # bytes held from the last chunk
+            need = _seq_len(self.held[0])
+            while self.held_n < need and i < n:
+                self.held[self.held_n] = data[i]
+                self.held_n += 1
+                i += 1
+            if self.held_n < need:
+                return m
+            held = self.held
+            self.held = bytearray(4)
+            self.held_n = 0
+            for k in range(1, need):
+                if held[k] & 0xC0 != 0x80:
+                    # broken sequence: only its lead byte goes, the held bytes
+                    # after it and those taken from data are scanned again
+                    m = self._encode(held, 1, kept, out, m)
+                    return self._feed(data, i - (need - kept), n, out, m)
+            m = self._encode(held, 0, need, out, m)
+        return self._encode(data, i, n, out, m)
+
+    def _encode(self, data, i, n, out, m):
+        while i < n:
+            b = data[i]
+            if b < 0x80:
+                if b == 9:
+                    out[m] = 32
+                    m += 1
+                elif b != 13:
+                    out[m] = b
+                    m += 1
+                i += 1
+                continue
+            if b < 0xC0:
+                i += 1                # stray continuation byte
+                continue
+            need = _seq_len(b)
+            if i + need > n:
+                for k in range(n - i):
+                    self.held[k] = data[i + k]
+                self.held_n = n - i
+                break
+            cp = b & (0x1F if need == 2 else (0x0F if need == 3 else 0x07))
+            for k in range(1, need):
+                c = data[i + k]
+                if c & 0xC0 != 0x80:
+                    cp = -1
+                    break
+                cp = (cp << 6) | (c & 0x3F)
+            if cp < 0:
+                i += 1                # broken sequence: drop its lead byte
+                continue
+            i += need
+            g = _CODE.get(cp)
+            if g is None:
+                g = UNKNOWN
+            for c in g:
+                out[m] = c
+                m += 1
+        return m
+
+    def feed(self, data: bytes) -> bytes:
+        if not self.held_n and _is_ascii(data):
+            return data
+        out = bytearray(2 * len(data) + 4)
+        return bytes(out[:self.feed_into(data, len(data), out)])
+
+    def flush(self) -> bytes:
+        if not self.held_n:
+            return b''
+        # an unfinished sequence: its lead byte goes, anything after it stays
+        held, n = self.held, self.held_n
+        out = bytearray(2 * n + 4)
+        m = self._encode(held, 1, n, out, 0)
+        self.held_n = 0
+        return bytes(out[:m])
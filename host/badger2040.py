@@ -0,0 +1,229 @@
+# ------------------------------------------------------------
+# host/badger2040.py  –  CPython stand-in for the badger2040 module
+# ------------------------------------------------------------
+# Badger2040 draws into a real 296x128 1bpp framebuffer (MSB = leftmost
+# pixel, 1 = black), counts every drawing call in .ops and adds the panel
+# refresh time of the current update speed to .sim_ms instead of
+# sleeping.  Buttons are whatever the script holds down with press().
+#
+# The firmware's own bitmap fonts aren't available here, so text() draws
+# a filled 1px-inset box per non-space character: enough for layout and
+# golden images, not a likeness.
+import zlib
+import struct
+
+WIDTH = 296
+HEIGHT = 128
+
+BUTTON_A = 12
+BUTTON_B = 13
+BUTTON_C = 14
+BUTTON_UP = 15
+BUTTON_DOWN = 11
+BUTTON_USER = 23
+
+UPDATE_NORMAL = 0
+UPDATE_MEDIUM = 1
+UPDATE_FAST = 2
+UPDATE_TURBO = 3
+
+# full refresh time of each update speed, as measured on the panel
+UPDATE_MS = {UPDATE_NORMAL: 1700, UPDATE_MEDIUM: 1000, UPDATE_FAST: 500, UPDATE_TURBO: 250}
+
+_BITMAP_FONTS = {"bitmap6": (6, 6), "bitmap8": (6, 8), "bitmap14_outline": (10, 14)}
+
+_woken_by = None
+
+# set by host/sim.py: "created"(display), "keepalive"(display), "elapsed"(ms)
+hooks = {}
+
+
+def woken_by_button():
+    return _woken_by is not None
+
+
+def pressed_to_wake(button):
+    return _woken_by == button
+
+
+class Halted(Exception):
+    """Raised by halt(): on battery the board powers off here."""
+
+
+class Badger2040:
+    def __init__(self):
+        self.fb = bytearray(WIDTH * HEIGHT // 8)
+        self.display = self.fb  # the firmware's PicoGraphics object exposes its framebuffer too
+        self.pen = 0
+        self.font = "bitmap8"
+        self.speed = UPDATE_NORMAL
+        self.led_level = 0
+        self.held = set()
+        self.sim_ms = 0
+        self.ops = {}
+        self.frames = []        # copies of fb at every update(), if keep_frames
+        self.keep_frames = False
+        if "created" in hooks:
+            hooks["created"](self)
+
+    # ------------------------------------------------ bookkeeping
+    def _count(self, op):
+        self.ops[op] = self.ops.get(op, 0) + 1
+
+    def reset_counts(self):
+        self.ops = {}
+        self.sim_ms = 0
+
+    # ------------------------------------------------ drawing
+    def set_pen(self, pen):
+        self.pen = pen
+
+    def _ink(self):
+        # the panel is 1bpp: the 16 pens are thresholded, not dithered
+        return self.pen < 8
+
+    def _span(self, x, y, w):
+        if y < 0 or y >= HEIGHT:
+            return
+        x0 = max(0, x)
+        x1 = min(WIDTH, x + w)
+        ink = self._ink()
+        row = y * (WIDTH // 8)
+        for px in range(x0, x1):
+            i = row + (px >> 3)
+            bit = 0x80 >> (px & 7)
+            if ink:
+                self.fb[i] |= bit
+            else:
+                self.fb[i] &= ~bit & 0xFF
+
+    def clear(self):
+        self._count("clear")
+        fill = 0xFF if self._ink() else 0x00
+        for i in range(len(self.fb)):
+            self.fb[i] = fill
+
+    def pixel(self, x, y):
+        self._count("pixel")
+        self._span(x, y, 1)
+
+    def rectangle(self, x, y, w, h):
+        self._count("rectangle")
+        for yy in range(y, y + h):
+            self._span(x, yy, w)
+
+    def line(self, x1, y1, x2, y2, thickness=1):
+        self._count("line")
+        dx, dy = abs(x2 - x1), -abs(y2 - y1)
+        sx = 1 if x1 < x2 else -1
+        sy = 1 if y1 < y2 else -1
+        err = dx + dy
+        while True:
+            self._span(x1, y1, thickness)
+            if x1 == x2 and y1 == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x1 += sx
+            if e2 <= dx:
+                err += dx
+                y1 += sy
+
+    def set_font(self, name):
+        self.font = name
+
+    def set_thickness(self, thickness):
+        pass
+
+    def measure_text(self, text, scale=1.0):
+        w, _ = _BITMAP_FONTS.get(self.font, (6, 8))
+        return int(len(text) * w * scale)
+
+    def text(self, text, x, y, wordwrap=WIDTH, scale=1.0):
+        self._count("text")
+        w, h = _BITMAP_FONTS.get(self.font, (6, 8))
+        w, h = int(w * scale), int(h * scale)
+        for c in text:
+            if c != " ":
+                for yy in range(y + 1, y + h - 1):
+                    self._span(x + 1, yy, w - 2)
+            x += w
+
+    # ------------------------------------------------ panel
+    def set_update_speed(self, speed):
+        self.speed = speed
+
+    def update(self):
+        self._count("update")
+        ms = UPDATE_MS.get(self.speed, UPDATE_MS[UPDATE_NORMAL])
+        self.sim_ms += ms
+        if "elapsed" in hooks:
+            hooks["elapsed"](ms)
+        if self.keep_frames:
+            self.frames.append(bytes(self.fb))
+
+    def partial_update(self, x, y, w, h):
+        self.update()
+
+    def led(self, brightness):
+        self.led_level = brightness
+
+    def keepalive(self):
+        if "keepalive" in hooks:
+            hooks["keepalive"](self)
+
+    def halt(self):
+        self._count("halt")
+        raise Halted()
+
+    # ------------------------------------------------ buttons
+    def press(self, button):
+        self.held.add(button)
+
+    def release(self, button=None):
+        if button is None:
+            self.held.clear()
+        else:
+            self.held.discard(button)
+
+    def pressed(self, button):
+        return button in self.held
+
+    def pressed_any(self):
+        return bool(self.held)
+
+    # ------------------------------------------------ frame dumps
+    def pixel_at(self, x, y):
+        return (self.fb[y * (WIDTH // 8) + (x >> 3)] >> (7 - (x & 7))) & 1
+
+    def save_pbm(self, path, fb=None):
+        with open(path, "wb") as f:
+            f.write(b"P4\n%d %d\n" % (WIDTH, HEIGHT))
+            f.write(fb if fb is not None else self.fb)
+
+    def save_png(self, path, fb=None):
+        fb = fb if fb is not None else self.fb
+        stride = WIDTH // 8
+        # PNG greyscale 1 bit: 1 = white, so invert the framebuffer
+        raw = b"".join(b"\x00" + bytes(~b & 0xFF for b in fb[y * stride:(y + 1) * stride])
+                       for y in range(HEIGHT))
+
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", WIDTH, HEIGHT, 1, 0, 0, 0, 0)))
+            f.write(chunk(b"IDAT", zlib.compress(raw)))
+            f.write(chunk(b"IEND", b""))
+
+
+def load_pbm(path) -> bytes:
+    """Framebuffer bytes of a P4 file written by save_pbm()."""
+    with open(path, "rb") as f:
+        data = f.read()
+    header = b"P4\n%d %d\n" % (WIDTH, HEIGHT)
+    if not data.startswith(header):
+        raise ValueError("not a %dx%d P4 image: %s" % (WIDTH, HEIGHT, path))
+    return data[len(header):]
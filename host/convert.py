@@ -0,0 +1,164 @@
+# ------------------------------------------------------------
+# host/convert.py  –  convert books on a PC, ready to copy to the badger
+# ------------------------------------------------------------
+# Every .epub and .txt in SRC is converted in a worker process that runs
+# the device code itself in the simulator: epub_xtract.run_extraction()
+# or convert_txt() makes the .gtx, and main.py's own render_page()
+# paginates it into the same .idx the reader would build, for the font
+# given with --font.  The output directory mirrors the flash:
+#
+#   OUT/books/<book>.gtx     glyph text
+#   OUT/state/..._<font>.idx page index (layout key, fingerprint, offsets)
+#   OUT/state/..._gtx.toc    chapter table (epub_xtract.save_chapters())
+#   OUT/manifest.json        what was converted from what
+#
+# Copy books/ and state/ to the root of the badger2040.  Books whose
+# source, font and options haven't changed since the last run are skipped.
+#
+#   python host/convert.py ~/ebooks out/ --jobs 4
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sim import REPO_DIR, Simulator
+
+BOOK_SOURCES = (".epub", ".txt")
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def convert_one(src, font, compress):
+    """
+    Convert one book in a private flash image; returns (name, {device path: bytes}, pages, log).
+    Runs in a worker process.
+    """
+    name = os.path.basename(src)
+    root = tempfile.mkdtemp(prefix="badger-convert-")
+    log = io.StringIO()
+    files = {}
+    pages = 0
+    try:
+        for d in ("books", "fonts", "state"):
+            os.makedirs(os.path.join(root, d))
+        shutil.copy(src, os.path.join(root, "books", name))
+        shutil.copy(os.path.join(REPO_DIR, "fonts", font), os.path.join(root, "fonts", font))
+        with open(os.path.join(root, "state", "font"), "w") as f:
+            f.write("/fonts/" + font)
+        with contextlib.redirect_stdout(log), Simulator(root) as sim:
+            main = sim.boot()
+            import epub_xtract
+            import glyphtext
+            src_path = "/books/" + name
+            book = src_path.rsplit(".", 1)[0] + glyphtext.EXT
+            toc = main["book_state_file"](book, ".toc")
+            if name.lower().endswith(".epub"):
+                ok = epub_xtract.run_extraction(src_path, glyph=True, compress=compress, chapters_path=toc)
+            else:
+                ok = epub_xtract.convert_txt(src_path) is not None and epub_xtract.save_chapters(toc, [0])
+            if not ok:
+                raise RuntimeError("conversion failed")
+            # paginate the whole book with the reader's own layout code
+            main["close_book"]()
+            main["text_file"] = book
+            main["state"]["current_page"] = 0
+            idx = main["index_file"](book)
+            main["load_book_index"](idx)
+            main["page_for_offset"](1 << 62)
+            main["save_index"](idx)
+            main["close_book"]()
+            pages = len(main["page_offsets"])
+            for path in (book, idx, toc):
+                with open(path, "rb") as f:     # device path, mapped by the simulator
+                    files[path] = f.read()
+        return name, files, pages, log.getvalue()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def load_manifest(out):
+    try:
+        with open(os.path.join(out, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "books": {}}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert .epub/.txt books for the badger2040 ebook reader.")
+    ap.add_argument("src", help="directory of .epub and .txt books")
+    ap.add_argument("out", help="output directory (mirrors the badger's flash)")
+    ap.add_argument("--font", default="vga2_8x16.bin", help="font in fonts/ to paginate for")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    ap.add_argument("--compress", action="store_true", help="store books block-compressed (needs deflate compression in the firmware)")
+    ap.add_argument("--force", action="store_true", help="convert even if the manifest says a book is up to date")
+    args = ap.parse_args()
+
+    manifest = load_manifest(args.out)
+    books = manifest["books"]
+    options = {"font": args.font, "compress": args.compress}
+    todo = []
+    for name in sorted(os.listdir(args.src)):
+        if not name.lower().endswith(BOOK_SOURCES):
+            continue
+        path = os.path.join(args.src, name)
+        st = os.stat(path)
+        entry = books.get(name)
+        if entry and not args.force and entry["options"] == options and entry["size"] == st.st_size:
+            if entry["mtime"] == st.st_mtime or entry["sha1"] == file_sha1(path):
+                entry["mtime"] = st.st_mtime
+                print(f"{name}: up to date")
+                continue
+        todo.append((name, path, st))
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(convert_one, path, args.font, args.compress): (name, path, st)
+                   for name, path, st in todo}
+        for fut in as_completed(futures):
+            name, path, st = futures[fut]
+            try:
+                _, files, pages, _ = fut.result()
+            except Exception as e:
+                print(f"{name}: FAILED ({e})")
+                failed += 1
+                continue
+            for old in books.get(name, {}).get("outputs", []):
+                if old not in files:
+                    with contextlib.suppress(OSError):
+                        os.remove(os.path.join(args.out, old.lstrip("/")))
+            for dev_path, data in files.items():
+                host_path = os.path.join(args.out, dev_path.lstrip("/"))
+                os.makedirs(os.path.dirname(host_path), exist_ok=True)
+                with open(host_path, "wb") as f:
+                    f.write(data)
+            books[name] = {"size": st.st_size, "mtime": st.st_mtime, "sha1": file_sha1(path),
+                           "options": options, "pages": pages, "outputs": sorted(files)}
+            size = sum(len(data) for dev_path, data in files.items() if dev_path.startswith("/books/"))
+            print(f"{name}: {pages} pages, {size} bytes")
+
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
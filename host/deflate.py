@@ -0,0 +1,99 @@
+# ------------------------------------------------------------
+# host/deflate.py  –  CPython stand-in for MicroPython's deflate module
+# ------------------------------------------------------------
+# DeflateIO(stream, format, wbits) on top of zlib: reading inflates from
+# stream, writing compresses into it.  Like the firmware, it only takes
+# a real stream (an io.IOBase here) and pulls input with readinto().
+import io
+import zlib
+
+AUTO = 0
+RAW = 1
+ZLIB = 2
+GZIP = 3
+
+_CHUNK = 256
+
+
+def _wbits(format, wbits, decompress):
+    wbits = wbits or 15
+    if format == RAW:
+        return -wbits
+    if format == GZIP:
+        return 16 + wbits
+    if format == AUTO and decompress:
+        return 32 + wbits
+    return wbits
+
+
+class DeflateIO:
+    def __init__(self, stream, format=AUTO, wbits=0, close=False):
+        # the firmware needs the C stream protocol; plain objects with read() don't have it
+        if not isinstance(stream, io.IOBase):
+            raise TypeError("stream operation not supported")
+        self.stream = stream
+        self.format = format
+        self.wbits = wbits
+        self.close_stream = close
+        self._d = None
+        self._c = None
+        self._out = b""
+        self._eof = False
+
+    # ------------------------------------------------ reading
+    def _fill(self, want):
+        if self._d is None:
+            self._d = zlib.decompressobj(_wbits(self.format, self.wbits, True))
+        while len(self._out) < want and not self._eof:
+            buf = bytearray(_CHUNK)
+            n = self.stream.readinto(buf)
+            data = bytes(buf[:n or 0])
+            if not data:
+                self._out += self._d.flush()
+                self._eof = True
+                break
+            self._out += self._d.decompress(data)
+            if self._d.eof:
+                self._eof = True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill(1 << 62)
+            data, self._out = self._out, b""
+            return data
+        self._fill(size)
+        data, self._out = self._out[:size], self._out[size:]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        line = b""
+        while True:
+            c = self.read(1)
+            line += c
+            if not c or c == b"\n":
+                return line
+
+    # ------------------------------------------------ writing
+    def write(self, data):
+        if self._c is None:
+            self._c = zlib.compressobj(9, zlib.DEFLATED, _wbits(self.format, self.wbits, False))
+        self.stream.write(self._c.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if self._c is not None:
+            self.stream.write(self._c.flush())
+            self._c = None
+        if self.close_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
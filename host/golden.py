@@ -0,0 +1,135 @@
+# ------------------------------------------------------------
+# host/golden.py  –  golden-image check of the page renderer
+# ------------------------------------------------------------
+# Boots main.py in the simulator against a small fixed flash image,
+# renders a set of screens and compares every framebuffer with
+# host/golden/<name>.pbm, printing the drawing calls each screen took.
+#
+#   python host/golden.py              # check, exit status 1 on a mismatch
+#   python host/golden.py --update     # accept the current images
+#   python host/golden.py --out DIR    # also write every screen as PNG
+#
+# A rendering optimization should leave the check passing while the
+# rectangle counts go down.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from sim import HOST_DIR, REPO_DIR, Simulator
+
+GOLDEN_DIR = os.path.join(HOST_DIR, "golden")
+
+SAMPLE_TEXT = (
+    "Chapter One\n"
+    "\n"
+    "The lighthouse keeper had counted the steps so many times that he no longer "
+    "heard the numbers, only the rhythm of his boots on the iron. One hundred and "
+    "twelve up, one hundred and twelve down, twice a night in fair weather and as "
+    "often as the lamp demanded when the fog came in from the sound.\n"
+    "\n"
+    "On the morning the letter arrived he was mending a net on the rocks below the "
+    "tower. The boy from the post office waved it above his head like a flag, "
+    "shouting something the wind carried away — “it’s from the city!” "
+    "— and then stood there, out of breath, while the keeper wiped his hands.\n"
+    "\n"
+    "Inside was a single page, folded twice. Café on the corner, it said, "
+    "Thursday at noon. It was not signed.\n"
+)
+
+
+def make_flash(root):
+    """Write the fixed flash image: two books, both fonts, state pointing at the .gtx."""
+    sys.path.insert(0, REPO_DIR)
+    import glyphtext
+    for d in ("books", "fonts", "state"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    text = SAMPLE_TEXT * 6
+    with open(os.path.join(root, "books", "sample.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+    with open(os.path.join(root, "books", "sample" + glyphtext.EXT), "wb") as f:
+        f.write(glyphtext.encode(text))
+    for name in ("vga2_8x16.bin", "vga2_8x16p.bin"):
+        shutil.copy(os.path.join(REPO_DIR, "fonts", name), os.path.join(root, "fonts", name))
+    with open(os.path.join(root, "state", "font"), "w") as f:
+        f.write("/fonts/vga2_8x16.bin")
+    book = ("/books/sample" + glyphtext.EXT).encode()
+    with open(os.path.join(root, "state", "ebook_state.bin"), "wb") as f:
+        f.write((0).to_bytes(4, "little") + len(book).to_bytes(2, "little") + book)
+
+
+def render_screens(root):
+    """[(name, framebuffer, ops)] for every screen of the check."""
+    screens = []
+    with Simulator(root) as sim:
+        main = sim.boot()
+        d = sim.display
+
+        def shot(name, draw):
+            d.reset_counts()
+            draw()
+            screens.append((name, bytes(d.fb), dict(d.ops)))
+
+        def show_book(book, page):
+            main["close_book"]()
+            main["text_file"] = book
+            main["load_book_index"](main["index_file"](book))
+            main["page_for_offset"](1 << 30 if page > 0 else 0)
+            shot_name = os.path.basename(book).replace(".", "_") + f"_page{page}"
+            shot(shot_name, lambda: main["render_page"](main["page_offsets"][page]))
+
+        screens.append(("boot", bytes(d.fb), dict(d.ops)))
+        show_book("/books/sample.gtx", 0)
+        show_book("/books/sample.gtx", 1)
+        show_book("/books/sample.txt", 0)
+        main["set_font"](main["load_font"]("/fonts/vga2_8x16p.bin"))
+        show_book("/books/sample.gtx", 0)
+        screens[-1] = ("proportional_page0",) + screens[-1][1:]
+        main["set_font"](main["load_font"]("/fonts/vga2_8x16.bin"))
+        shot("file_list", lambda: main["draw_file_list"](main["get_text_files"]("/books"), 1))
+        main["close_book"]()
+    return screens
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--update", action="store_true", help="store the current screens as golden images")
+    ap.add_argument("--out", help="directory to write every screen to as PNG")
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="badger-flash-")
+    try:
+        make_flash(root)
+        screens = render_screens(root)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    import badger2040
+    panel = badger2040.Badger2040()
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    failed = 0
+    for name, fb, ops in screens:
+        golden = os.path.join(GOLDEN_DIR, name + ".pbm")
+        counts = " ".join(f"{k}={v}" for k, v in sorted(ops.items()))
+        if args.update:
+            panel.save_pbm(golden, fb)
+            result = "updated"
+        elif not os.path.exists(golden):
+            result = "MISSING"
+            failed += 1
+        else:
+            want = badger2040.load_pbm(golden)
+            diff = sum(bin(a ^ b).count("1") for a, b in zip(fb, want))
+            result = "ok" if diff == 0 else f"DIFF {diff} px"
+            failed += diff != 0
+        if args.out:
+            panel.save_png(os.path.join(args.out, name + ".png"), fb)
+        print(f"{name:<20} {result:<12} {counts}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
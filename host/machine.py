@@ -0,0 +1,39 @@
+# ------------------------------------------------------------
+# host/machine.py  –  CPython stand-in for the parts of machine in use
+# ------------------------------------------------------------
+# ADC reads a fixed value (a battery at about 3.9 V through the Badger's
+# 1:3 divider, so the battery indicator is stable in golden images).
+BATTERY_U16 = 25800
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, pin, mode=IN, pull=None):
+        self.pin = pin
+        self.mode = mode
+        self._value = 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def read_u16(self):
+        return BATTERY_U16
+
+
+def idle():
+    pass
+
+
+def freq(hz=None):
+    return 125_000_000
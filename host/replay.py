@@ -0,0 +1,99 @@
+# ------------------------------------------------------------
+# host/replay.py  –  replay a button trace in the simulator and report
+# ------------------------------------------------------------
+# Boots main.py against a flash image and feeds it the presses of a
+# button trace (see buttontrace.py) through the same Player the device
+# uses with TRACE = "replay", then prints the per-event report: latency
+# to the next display update in simulated ms, page layouts, drawing
+# calls and file writes.
+#
+#   python host/replay.py                          # built-in session on golden.py's flash
+#   python host/replay.py --trace trace.btr        # a trace recorded on the badger
+#   python host/replay.py --flash DIR --trace ...  # against a copy of a flash image
+#
+# Simulated time only moves with sleeps and panel refreshes, so the
+# latencies count refreshes and waits, not CPU time; the layout, draw and
+# write counts are exact.  Run it before and after a change to compare.
+import argparse
+import shutil
+import sys
+import tempfile
+
+from golden import make_flash
+from sim import REPO_DIR, Simulator
+
+sys.path.insert(0, REPO_DIR)
+import buttontrace  # noqa: E402
+
+A, B, C, UP, DOWN = 12, 13, 14, 15, 11
+
+# turn pages, turn back, skim ahead with a long press, switch books and back
+SESSION = [
+    (1000, DOWN), (4000, DOWN), (7000, DOWN), (10000, UP),
+    (13000, DOWN, 900),
+    (17000, A), (20000, DOWN), (23000, A),
+    (27000, DOWN),
+    (30000, A), (33000, UP), (36000, A),
+    (40000, DOWN),
+]
+
+
+def session_events():
+    events = []
+    for press in SESSION:
+        ms, button = press[:2]
+        hold = press[2] if len(press) > 2 else 100
+        events += [(ms, button, True), (ms + hold, button, False)]
+    return events
+
+
+def replay(root, events):
+    """Run main.py on events; returns the finished Player."""
+    player = []
+
+    def script(sim, n):
+        if n == 0:
+            player.append(buttontrace.Player(sim.display, events))
+            player[0].instrument(sim.main)
+
+    with Simulator(root) as sim:
+        try:
+            sim.boot(script)
+        except buttontrace.ReplayDone:
+            pass
+        else:
+            # main.py went to sleep before the trace ended
+            if player:
+                player[0].unwrap()
+                buttontrace.finish(player[0], "/state/trace_report.txt")
+    return player[0] if player else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a button trace in the simulator.")
+    ap.add_argument("--trace", help="trace file (default: a built-in session)")
+    ap.add_argument("--flash", help="directory with books/, fonts/ and state/ (copied, never changed)")
+    ap.add_argument("--out", help="also write the report to this file")
+    args = ap.parse_args()
+
+    events = buttontrace.load(args.trace) if args.trace else session_events()
+    root = tempfile.mkdtemp(prefix="badger-replay-")
+    try:
+        if args.flash:
+            shutil.copytree(args.flash, root, dirs_exist_ok=True)
+        else:
+            make_flash(root)
+        player = replay(root, events)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    if player is None:
+        print("main.py stopped before its main loop")
+        return 1
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(player.report() + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
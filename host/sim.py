@@ -0,0 +1,135 @@
+# ------------------------------------------------------------
+# host/sim.py  –  run main.py on a PC against a sandboxed flash
+# ------------------------------------------------------------
+# Simulator puts host/ (the badger2040, machine and deflate stand-ins)
+# in front of sys.path, maps the device filesystem into a directory
+# (absolute and relative paths alike, the device cwd being "/"), and
+# replaces time.sleep/ticks_* with a simulated clock so nothing waits.
+#
+#   with Simulator(root) as sim:
+#       main = sim.boot()               # runs main.py up to its main loop
+#       main["render_page"](0)
+#       sim.display.save_png("page.png")
+#
+# boot(script) keeps the main loop running instead: script(sim, n) is
+# called at every keepalive() and stops the run by raising StopSim.
+import builtins
+import os
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+
+# f_bsize, f_frsize, f_blocks, f_bfree, f_bavail, ... of a 1.5 MB flash, half free
+STATVFS = (4096, 4096, 384, 192, 192, 0, 0, 0, 0, 255)
+
+
+class StopSim(Exception):
+    """Raised by a script (or the default keepalive) to leave main.py."""
+
+
+class Clock:
+    """Milliseconds that only move when the code sleeps or the panel refreshes."""
+    def __init__(self):
+        self.ms = 0
+
+    def ticks_ms(self):
+        return self.ms
+
+    def ticks_us(self):
+        return self.ms * 1000
+
+    def sleep(self, s):
+        self.ms += int(s * 1000)
+
+    def sleep_ms(self, ms):
+        self.ms += int(ms)
+
+
+class Simulator:
+    def __init__(self, root, repo=REPO_DIR):
+        self.root = os.path.abspath(root)
+        self.repo = repo
+        self.clock = Clock()
+        self.display = None
+        self.main = None
+        self._saved = []
+
+    # ------------------------------------------------ filesystem
+    def path(self, p):
+        """Host path of device path p."""
+        if isinstance(p, int):
+            return p
+        p = os.fspath(p)
+        return os.path.join(self.root, p.lstrip("/"))
+
+    def _patch(self, obj, name, value):
+        self._saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def __enter__(self):
+        real_open = self._open = builtins.open
+        real = {n: getattr(os, n) for n in ("stat", "listdir", "mkdir", "remove", "rename")}
+        self._patch(builtins, "open", lambda p, *a, **k: real_open(self.path(p), *a, **k))
+        self._patch(os, "stat", lambda p: real["stat"](self.path(p)))
+        self._patch(os, "listdir", lambda p="": real["listdir"](self.path(p)))
+        self._patch(os, "mkdir", lambda p, *a: real["mkdir"](self.path(p)))
+        self._patch(os, "remove", lambda p: real["remove"](self.path(p)))
+        self._patch(os, "rename", lambda a, b: real["rename"](self.path(a), self.path(b)))
+        self._patch(os, "statvfs", lambda p: STATVFS)
+        c = self.clock
+        self._patch(time, "sleep", c.sleep)
+        for name in ("ticks_ms", "ticks_us", "sleep_ms"):
+            self._saved.append((time, name, getattr(time, name, None)))
+            setattr(time, name, getattr(c, name))
+        self._saved.append((time, "ticks_add", getattr(time, "ticks_add", None)))
+        self._saved.append((time, "ticks_diff", getattr(time, "ticks_diff", None)))
+        time.ticks_add = lambda a, b: a + b
+        time.ticks_diff = lambda a, b: a - b
+        for d in (self.repo, HOST_DIR):
+            if d in sys.path:
+                sys.path.remove(d)
+            sys.path.insert(0, d)
+        for name in ("badger2040", "machine", "deflate"):
+            sys.modules.pop(name, None)
+        return self
+
+    def __exit__(self, *exc):
+        while self._saved:
+            obj, name, value = self._saved.pop()
+            if value is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+
+    # ------------------------------------------------ running main.py
+    def boot(self, script=None):
+        """
+        Run main.py; return its globals. Without a script it stops at the
+        first keepalive() of the main loop, i.e. right after start-up.
+        """
+        import badger2040
+        calls = [0]
+
+        def keepalive(display):
+            self.display = display
+            n = calls[0]
+            calls[0] += 1
+            if script is None:
+                raise StopSim()
+            script(self, n)
+
+        badger2040.hooks["keepalive"] = keepalive
+        badger2040.hooks["created"] = lambda d: setattr(self, "display", d)
+        badger2040.hooks["elapsed"] = self.clock.sleep_ms
+        with self._open(os.path.join(self.repo, "main.py")) as f:
+            code = compile(f.read(), "main.py", "exec")
+        self.main = {"__name__": "main"}
+        try:
+            exec(code, self.main)
+        except (StopSim, badger2040.Halted):
+            pass
+        finally:
+            badger2040.hooks.clear()
+        return self.main
@@ -2,15 +2,29 @@
 # main.py — updated with EPUB support
 #############################################
 import badger2040
-import gc
 import time
 import os
+import gc
 import struct
-import vga2_8x16
+from array import array
+import fontfile
+import memstat
+MEMSTAT = False   # record heap use per operation; memstat.dump() at the REPL after Ctrl-C
+if MEMSTAT:
+    memstat.enable()  # before the imports below, so their @memstat.measured functions are wrapped
 from machine import ADC, Pin
 # --- NEW IMPORTS ---
 import epub_xtract # ← ADD THIS
-from epub_xtract import run_extraction # ← ADD THIS
+from epub_xtract import ExtractionJob
+import glyphtext
+import pagebook
+import blockzip
+import booksearch
+import buttontrace
+import booksessions
+from pageindex import PageIndex, TAIL_MAX
+import storage
+from epubstream import EpubStream
 #############################################
 STATE_FILE = "/state/ebook_state.bin"
 # Create directories if they don't exist
@@ -48,45 +62,142 @@ def state_load():
     except Exception as e:
         print("state_load failed:", e)
     return state
+# ---------------- RESUME -----------------
+# written just before halt(): the page on the panel and the prerendered
+# next page, so a wake from sleep only has to draw the next page again
+RESUME_FILE = "/state/resume.bin"
+RESUME_MAGIC = b"RSM1"
+def resume_save(book, font_path, page, offset, next_offset, next_remainder):
+    try:
+        with open(RESUME_FILE, "wb") as f:
+            f.write(struct.pack("<4sIIiH", RESUME_MAGIC, page, offset, next_offset, len(next_remainder)))
+            f.write(next_remainder)
+            for s in (book, font_path or ""):
+                b = s.encode("utf-8")
+                f.write(struct.pack("<H", len(b)))
+                f.write(b)
+    except Exception as e:
+        print("resume_save failed:", e)
+def resume_load():
+    """The saved resume point as a dict, or None. One-shot: the file is removed."""
+    try:
+        with open(RESUME_FILE, "rb") as f:
+            magic, page, offset, next_offset, n = struct.unpack("<4sIIiH", f.read(18))
+            if magic != RESUME_MAGIC:
+                return None
+            next_remainder = f.read(n)
+            strs = []
+            for _ in range(2):
+                l = struct.unpack("<H", f.read(2))[0]
+                strs.append(f.read(l).decode("utf-8"))
+        return {"page": page, "offset": offset, "next_offset": next_offset,
+                "next_remainder": next_remainder, "book": strs[0], "font": strs[1]}
+    except OSError:
+        return None
+    except Exception as e:
+        print("resume_load failed:", e)
+        return None
+    finally:
+        resume_clear()
+def resume_clear():
+    try:
+        os.remove(RESUME_FILE)
+    except OSError:
+        pass
+# ---------------- FONT FILES -----------------
+FONT_DIR = "/fonts"
+FONT_STATE = "/state/font"
+DEFAULT_FONT = FONT_DIR + "/vga2_8x16.bin"
+FONT_LAZY = True   # page glyph blocks in on demand instead of loading all 256
+def load_font(path):
+    try:
+        return fontfile.Font(path, lazy=FONT_LAZY)
+    except Exception as e:
+        print("load_font failed:", e)
+        import vga2_8x16
+        return fontfile.Font(module=vga2_8x16)
+def font_files():
+    try:
+        return sorted([f"{FONT_DIR}/{f}" for f in os.listdir(FONT_DIR) if f.endswith(".bin")])
+    except OSError:
+        return []
+def saved_font_path():
+    try:
+        with open(FONT_STATE) as f:
+            return f.read().strip() or DEFAULT_FONT
+    except OSError:
+        return DEFAULT_FONT
 # ---------------- CONFIG -----------------
-LINES_PER_PAGE = 9
-LINE_HEIGHT = vga2_8x16.HEIGHT - 2
 TEXT_PADDING = 2
 WIDTH = badger2040.WIDTH
 TEXT_WIDTH = WIDTH - TEXT_PADDING*2
-MAX_CHARS = TEXT_WIDTH // vga2_8x16.WIDTH
+def set_font(new_font):
+    global font, LINE_HEIGHT, MAX_CHARS, SPACE_PX, LINES_PER_PAGE
+    font = new_font
+    LINE_HEIGHT = font.HEIGHT - 2
+    MAX_CHARS = TEXT_WIDTH // font.WIDTH
+    SPACE_PX = font.width_of(32)
+    LINES_PER_PAGE = (badger2040.HEIGHT - 2) // LINE_HEIGHT
+set_font(load_font(saved_font_path()))
+TRACE = None      # "record" button presses to /state/trace.btr, or "replay" them as a benchmark (buttontrace.py)
 INACTIVITY_TIMEOUT = 60*1000
 BOOK_DIR = "/books"
+CACHE_QUOTA = None              # bytes of indexes and converted copies to keep, None = until space runs out
+DELETE_CONVERTED_EPUBS = False  # remove an .epub once its .gtx is complete
 last = time.ticks_ms()
 # ---------------- DISPLAY -----------------
 display = badger2040.Badger2040()
 display.set_update_speed(badger2040.UPDATE_TURBO)
 display.led(0)
+def framebuffer():
+    """The panel's packed framebuffer, or None if this firmware doesn't expose it."""
+    try:
+        return memoryview(display.display)
+    except (AttributeError, TypeError):
+        return None
+# a copy of the page on the panel, so a book switched away from can be put back without a layout
+display_fb = framebuffer()
+screen_copy = bytearray(len(display_fb)) if display_fb is not None else None
+screen_at = None   # (book, page offset) in screen_copy
+def remember_screen():
+    """Called right after a reading page was shown, before the next one is prerendered."""
+    global screen_at
+    if screen_copy is not None:
+        screen_copy[:] = display_fb
+        screen_at = (text_file, page_offsets[state["current_page"]])
 # ---------------- FONT -----------------
 def character(asci, x, y, pen_color=0):
-    if asci < vga2_8x16.FIRST or asci > vga2_8x16.LAST:
-        asci = ord('?')
-    idx = (asci - vga2_8x16.FIRST) * vga2_8x16.HEIGHT
+    rows = font.glyph(asci)
+    rb = font.row_bytes
+    top = rb * 8 - 1
     display.set_pen(pen_color)
-    for y_off in range(vga2_8x16.HEIGHT):
-        row = vga2_8x16.FONT[idx + y_off]
+    for y_off in range(font.HEIGHT):
+        if rb == 1:
+            row = rows[y_off]
+        else:
+            row = int.from_bytes(rows[y_off * rb:(y_off + 1) * rb], "big")
         start = -1
-        for x_off in range(vga2_8x16.WIDTH):
-            set_pixel = (row >> (7 - x_off)) & 1
+        for x_off in range(font.WIDTH):
+            set_pixel = (row >> (top - x_off)) & 1
             if set_pixel and start == -1:
                 start = x_off
             elif not set_pixel and start != -1:
                 display.rectangle(x + start, y + y_off, x_off - start, 1)
                 start = -1
         if start != -1:
-            display.rectangle(x + start, y + y_off, vga2_8x16.WIDTH - start, 1)
+            display.rectangle(x + start, y + y_off, font.WIDTH - start, 1)
 def prnt(text, x, y, pen_color=0):
     text = text.replace("\u201c", '"').replace("\u201d", '"').replace("\u2019", "'")\
                .replace("\u2014", "-").replace("\u2013", "-")
     for c in text:
-        character(ord(c) if vga2_8x16.FIRST <= ord(c) <= vga2_8x16.LAST else ord('?'),
-                  x, y, pen_color=pen_color)
-        x += vga2_8x16.WIDTH
+        g = ord(c) if font.FIRST <= ord(c) <= font.LAST else ord('?')
+        character(g, x, y, pen_color=pen_color)
+        x += font.width_of(g)
+def prnt_glyphs(data, x, y, pen_color=0):
+    # glyph text: every byte already is a FONT index
+    for g in data:
+        character(g, x, y, pen_color=pen_color)
+        x += font.width_of(g)
 # ---------------- BATTERY -----------------
 def battery_percent():
     vref = Pin(27, Pin.OUT)
@@ -98,8 +209,16 @@ def battery_percent():
     voltage = reading * (3.3 / 65535) * 3
     return int(max(0, min(100, (voltage - 3.2) / (4.1 - 3.2) * 100)))
 # ---------------- INDEX -----------------
-page_offsets = [0]
+def book_state_file(book, ext):
+    return storage.state_file(book, ext)
+def index_file(book):
+    # page breaks depend on the font, so every font keeps its own index
+    tag = font.path.split("/")[-1].split(".")[0] if font.path else "builtin"
+    return book_state_file(book, "_" + tag + ".idx")
+page_offsets = PageIndex()
 page_remainders = {}
+book_end = -1   # end of the text body for .pgb books, -1 otherwise
+pgb_body = None  # (start, end) of a .pgb wrapped for another layout, read as plain glyph text
 # ---- NEW: limit how many remainders we keep ----
 MAX_REMAINDERS = 9
 def prune_remainders(keep_page):
@@ -112,104 +231,531 @@ def prune_remainders(keep_page):
             del page_remainders[k]
         except KeyError:
             pass
-def save_index(idx_file):
+# .idx layout: "BIX3", u32 layout key, u32 book size, u32 book hash,
+# u32 reading offset, u32 page count, u32 flags, then u32 page offsets.
+# The layout key and the fingerprint (size plus a hash of the first and
+# last bytes of the file) tell whether the offsets still fit; the reading
+# offset is kept either way, so a stale index only costs a re-pagination
+# around it.  INDEX_COMPLETE is set once the offsets run from the start of
+# the book to its end; a prefix saved by an interrupted IndexJob lacks it.
+# The offsets stay on flash and are read a segment at a time (pageindex.py);
+# saving appends the new ones and rewrites the header.
+INDEX_MAGIC = b"BIX3"
+INDEX_HEADER_FMT = "<4sIIIIII"
+INDEX_HEADER_SIZE = 28
+INDEX_COMPLETE = 1
+# "BIX2" indexes have no flags and are read as incomplete
+INDEX_MAGIC_V2 = b"BIX2"
+INDEX_HEADER_FMT_V2 = "<4sIIIII"
+INDEX_HEADER_SIZE_V2 = 24
+FINGERPRINT_BYTES = 512
+REFLOW_AHEAD = 64 * 1024   # further than this, start a partial index at the offset instead
+def fnv1a(data, h=0x811C9DC5):
+    for b in data:
+        h = ((h ^ b) * 0x01000193) & 0xFFFFFFFF
+    return h
+def layout_key():
+    return fnv1a(f"{font.path}|{font.WIDTH}x{font.HEIGHT}|{TEXT_WIDTH}|{LINES_PER_PAGE}|{LINE_HEIGHT}".encode())
+fingerprint_cache = (None, (0, 0))
+def book_fingerprint(path):
+    """(size, hash of the first and last FINGERPRINT_BYTES) of the file on flash."""
+    global fingerprint_cache
+    try:
+        size = os.stat(path)[6]
+        if fingerprint_cache[0] == path and fingerprint_cache[1][0] == size:
+            return fingerprint_cache[1]
+        with open(path, "rb") as f:
+            h = fnv1a(f.read(FINGERPRINT_BYTES))
+            f.seek(max(0, size - FINGERPRINT_BYTES))
+            h = fnv1a(f.read(FINGERPRINT_BYTES), h)
+        fingerprint_cache = (path, (size, h))
+    except OSError:
+        return (0, 0)
+    return fingerprint_cache[1]
+def write_index(idx_file, book, offsets, position, complete=False):
+    """Save offsets (a PageIndex) with a header for book; idx_file backs them from then on."""
+    size, h = book_fingerprint(book)
     try:
-        with open(idx_file, "wb") as f:
-            f.write(struct.pack("<H", len(page_offsets)))
-            for off in page_offsets:
-                f.write(struct.pack("<I", off))
-            f.write(struct.pack("<H", 0))
+        offsets.save(idx_file, struct.pack(INDEX_HEADER_FMT, INDEX_MAGIC, layout_key(), size, h,
+                                           position, len(offsets), INDEX_COMPLETE if complete else 0))
     except Exception as e:
         print("save_index failed:", e)
+def index_complete():
+    """True if page_offsets run from the start of text_file to its end."""
+    if page_offsets[0] != 0 or text_file.endswith(".epub"):
+        return False
+    try:
+        return page_offsets[-1] >= blockzip.size_of(book_file())
+    except Exception:
+        return False
+def save_index(idx_file):
+    page = min(state["current_page"], len(page_offsets) - 1)
+    # .pgb carries its own page table, only the reading offset is kept
+    if book_end >= 0:
+        write_index(idx_file, text_file, PageIndex(()), page_offsets[page])
+    else:
+        write_index(idx_file, text_file, page_offsets, page_offsets[page], index_complete())
+def read_index_header(idx_file):
+    """(magic, key, size, hash, position, count, flags, header size) of an .idx, or None."""
+    try:
+        with open(idx_file, "rb") as f:
+            head = f.read(INDEX_HEADER_SIZE)
+        if head[:4] == INDEX_MAGIC:
+            return struct.unpack(INDEX_HEADER_FMT, head) + (INDEX_HEADER_SIZE,)
+        if head[:4] == INDEX_MAGIC_V2:
+            return struct.unpack(INDEX_HEADER_FMT_V2, head[:INDEX_HEADER_SIZE_V2]) + (0, INDEX_HEADER_SIZE_V2)
+    except Exception:
+        pass
+    return None
+def index_current(idx_file, book):
+    """True if idx_file is a complete index of book as it is now, for the current layout."""
+    head = read_index_header(idx_file)
+    return (bool(head) and head[5] > 0 and head[6] & INDEX_COMPLETE and head[1] == layout_key()
+            and head[2:4] == book_fingerprint(book))
+def index_anchor(idx_file):
+    """(layout key, (size, hash), first page offset) an .idx was written with, or None."""
+    head = read_index_header(idx_file)
+    if not head or not head[5]:
+        return None
+    try:
+        with open(idx_file, "rb") as f:
+            f.seek(head[7])
+            return head[1], head[2:4], struct.unpack("<I", f.read(4))[0]
+    except Exception:
+        return None
+def spill_index():
+    """Append a long run of new page offsets to the .idx instead of holding them in RAM."""
+    if book_end < 0 and len(page_offsets.tail) >= TAIL_MAX:
+        # the reading position stays whatever was saved last
+        head = read_index_header(index_file(text_file))
+        write_index(index_file(text_file), text_file, page_offsets, head[4] if head else 0)
 def load_index(idx_file):
-    global page_offsets, page_remainders
+    """(matches, reading offset or -1, page offsets) from an .idx, or None if there is none."""
     try:
-        if os.stat(idx_file)[6] > 0:
+        head = read_index_header(idx_file)
+        if head is None:
             with open(idx_file, "rb") as f:
-                page_offsets = []
-                n_offsets = struct.unpack("<H", f.read(2))[0]
-                for _ in range(n_offsets):
-                    page_offsets.append(struct.unpack("<I", f.read(4))[0])
-                n_rem = struct.unpack("<H", f.read(2))[0]
-                page_remainders = {}
-                for _ in range(n_rem):
-                    k = struct.unpack("<H", f.read(2))[0]
-                    l = struct.unpack("<H", f.read(2))[0]
-                    page_remainders[k] = f.read(l)
-            return True
+                # index from before layout keys: trust the offsets, position from state
+                n = struct.unpack("<H", f.read(2))[0]
+                return True, -1, PageIndex(array("I", f.read(4 * n)))
+        _, key, size, h, position, n, _, base = head
+        matches = key == layout_key() and (size, h) == book_fingerprint(text_file)
+        # the offsets are read from flash as they are needed
+        return matches, position, PageIndex((), idx_file, base, n) if matches else None
+    except OSError:
+        pass
     except Exception as e:
         print("load_index failed:", e)
-    return False
+    return None
 def index_exists(idx_file):
     try:
         return os.stat(idx_file)[6] > 0
     except OSError:
         return False
+@memstat.measured("index_load")
+def load_book_index(idx_file):
+    """
+    Set up page offsets for text_file and return the saved reading offset (-1 if unknown).
+    A missing or stale index leaves a partial index that starts at the saved offset.
+    """
+    global page_offsets, page_remainders, book_end
+    book_end = -1
+    page_remainders = {}
+    saved = load_index(idx_file)
+    position = saved[1] if saved else -1
+    body = None
+    if text_file.endswith(pagebook.EXT):
+        layout = pagebook.read_layout(text_file)
+        if layout:
+            if layout[0] == MAX_CHARS and layout[1] == LINES_PER_PAGE and font.advance is None:
+                use_pgb_body(None)
+                page_offsets = layout[2] if len(layout[2]) else PageIndex([pagebook.HEADER_SIZE])
+                book_end = layout[3]
+                return position
+            # wrapped for another font: lay its text out again like a .gtx
+            print("pgb layout differs, re-wrapping:", layout[0], layout[1])
+            body = (pagebook.HEADER_SIZE, layout[3])
+    use_pgb_body(body)
+    if saved and saved[0] and saved[2]:
+        page_offsets = saved[2]
+        return position
+    if saved:
+        print("index is stale, re-paginating around", position)
+    page_offsets = PageIndex([line_start(position) if position > 0 else 0])
+    return position
+def line_start(offset, window=1024):
+    """Start of the line holding offset, looking back at most window bytes."""
+    try:
+        f = book_file()
+        start = max(0, offset - window)
+        f.seek(start)
+        data = f.read(offset - start)
+        nl = data.rfind(b"\n")
+        if nl != -1:
+            return start + nl + 1
+        return 0 if start == 0 else offset
+    except Exception as e:
+        print("line_start failed:", e)
+        return offset
+# ---------------- BOOK FILE -----------------
+# kept open between pages so block-compressed books keep their block cache
+# and EPUBs read in place keep their decode position
+book_handle = None
+book_handle_path = None
+def book_file():
+    global book_handle, book_handle_path
+    if book_handle_path != text_file:
+        close_book()
+        if text_file.endswith(".epub"):
+            book_handle = EpubStream(text_file, book_state_file(text_file, ".chk"), book_fingerprint(text_file))
+        else:
+            book_handle = blockzip.open_book(text_file)
+            if pgb_body:
+                book_handle = pagebook.BodyView(book_handle, *pgb_body)
+        book_handle_path = text_file
+    return book_handle
+def use_pgb_body(body):
+    """Read the open .pgb's text body (start, end) as plain glyph text, or the file as is for None."""
+    global pgb_body
+    if body != pgb_body:
+        close_book()
+        pgb_body = body
+def close_book():
+    global book_handle, book_handle_path
+    if book_handle:
+        book_handle.close()
+    book_handle = None
+    book_handle_path = None
+def find_page(offset):
+    """Last known page starting at or before offset."""
+    return page_offsets.find(offset)
+def reflow(offset):
+    """Paginate from the start with the current layout up to offset; return the page holding it."""
+    global page_offsets, page_remainders
+    if book_end >= 0 or (page_offsets[0] == 0 and page_offsets[-1] >= offset):
+        # .pgb pages are fixed, and a complete index already covers offset
+        return find_page(offset)
+    page_offsets = PageIndex()
+    page_remainders = {}
+    page = 0
+    rem = b""
+    while True:
+        nxt, rem_next = render_page(page_offsets[page], draw=False, remainder=rem)
+        if nxt <= page_offsets[page] or nxt > offset:
+            break
+        page_offsets.append(nxt)
+        page += 1
+        page_remainders[page] = rem_next
+        rem = rem_next
+        prune_remainders(page)
+        spill_index()
+        memstat.collect()
+    return page
+def page_for_offset(offset):
+    """Page holding offset, paginating as far as needed."""
+    while book_end < 0 and page_offsets[-1] < offset:
+        page = len(page_offsets) - 1
+        nxt, _ = render_page(page_offsets[page], draw=False)
+        if nxt <= page_offsets[page]:
+            break
+        page_offsets.append(nxt)
+        spill_index()
+        memstat.collect()
+    return page_offsets.find(offset)
+def page_at(offset):
+    """
+    Page holding offset, keeping the user's place: the index is used when it
+    reaches offset, paginated forward when offset is near its end, and
+    otherwise replaced by a partial index starting at offset's line.
+    """
+    global page_offsets, page_remainders
+    if book_end < 0 and (offset < page_offsets[0] or offset - page_offsets[-1] > REFLOW_AHEAD):
+        page_offsets = PageIndex([line_start(offset)])
+        page_remainders = {}
+    return page_for_offset(offset)
+def fill_front():
+    """Paginate the part of a partial index before its first page; return the page before that one."""
+    anchor = page_offsets[0]
+    page = reflow(anchor)
+    # make sure the anchored page has a successor to prerender
+    page_for_offset(page_offsets[-1] + 1)
+    return page if page_offsets[page] < anchor else max(0, page - 1)
+# ---------------- BACKGROUND EXTRACTION -----------------
+# an EPUB read in place is converted to .gtx a slice at a time while idle
+IDLE_BEFORE_WORK = 3000
+extract_job = None
+def start_extraction_job():
+    global extract_job
+    if extract_job:
+        extract_job.suspend()
+    extract_job = None
+    ingest_drop(text_file)
+    if text_file.endswith(".epub"):
+        extract_job = ExtractionJob(text_file, state_file=book_state_file(text_file, ".job"))
+def adopt_extracted_book():
+    """Switch to the finished .gtx; it has the EPUB stream's exact bytes, so the index carries over."""
+    global extract_job, text_file, INDEX_FILE
+    job = extract_job
+    extract_job = None
+    if not job.ok:
+        if not job.no_space:
+            conversion_failed(job)
+        return
+    old_book = text_file
+    close_book()
+    text_file = job.out_path
+    INDEX_FILE = index_file(text_file)
+    save_index(INDEX_FILE)
+    state["last_book"] = text_file
+    state_save(state)
+    for path in (index_file(old_book), book_state_file(old_book, ".chk")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    storage.touch(text_file)
+    converted(job)
+def conversion_failed(job):
+    """A member of job's EPUB couldn't be converted: say so, and leave it be until the EPUB changes."""
+    print("conversion failed, reading", job.epub_path, "in place")
+    try:
+        convert_failed[job.epub_path] = os.stat(job.epub_path)[6]
+    except OSError:
+        pass
+def converted(job):
+    """A conversion finished: drop its EPUB if configured to."""
+    if DELETE_CONVERTED_EPUBS and job.ok:
+        if storage.remove_converted_source(job.epub_path, job.out_path, job.writer.bytes):
+            print("removed", job.epub_path)
+# ---------------- INGEST QUEUE -----------------
+# other books in /books are got ready while idle: EPUBs without a .gtx are
+# converted, then every .txt/.gtx without an up to date index is paginated.
+# Books after the open one in picker order (the next volume) go first.
+# The first scan waits for the first idle spell, so it never delays boot.
+INGEST_RESCAN_MS = 30000
+ingest_queue = []
+ingest_job = None
+no_space = {}   # EPUB -> free bytes when it didn't fit; retried once there is more
+convert_failed = {}   # EPUB -> its size when a member failed; retried once it changes
+ingest_scanned = time.ticks_add(time.ticks_ms(), -INGEST_RESCAN_MS)
+BUTTONS = (badger2040.BUTTON_A, badger2040.BUTTON_B, badger2040.BUTTON_C,
+           badger2040.BUTTON_UP, badger2040.BUTTON_DOWN)
+def button_pressed():
+    for b in BUTTONS:
+        if display.pressed(b):
+            return True
+    return False
+def use_book(path):
+    """Point the renderer at another book; returns what restore_book() needs."""
+    global text_file, book_end, book_handle, book_handle_path, pgb_body
+    saved = (text_file, book_end, book_handle, book_handle_path, pgb_body)
+    text_file, book_end, book_handle, book_handle_path, pgb_body = path, -1, None, None, None
+    return saved
+def restore_book(saved):
+    global text_file, book_end, book_handle, book_handle_path, pgb_body
+    close_book()
+    text_file, book_end, book_handle, book_handle_path, pgb_body = saved
+class IndexJob:
+    """Time-sliced pagination of a book that isn't open; saves its index as it goes."""
+    def __init__(self, book):
+        self.book = book
+        self.offsets = None
+        self.done = False
+    def _resume(self):
+        # carry on from the prefix an interrupted job (or the reader) saved
+        saved = load_index(index_file(self.book))
+        if saved and saved[0] and saved[2] and saved[2][0] == 0:
+            return saved[2]
+        return PageIndex()
+    def step(self, budget_ms=epub_xtract.SLICE_MS, stop=None):
+        deadline = time.ticks_add(time.ticks_ms(), budget_ms)
+        saved = use_book(self.book)
+        try:
+            if self.offsets is None:
+                self.offsets = self._resume()
+            while True:
+                start = self.offsets[-1]
+                nxt, _ = render_page(start, draw=False)
+                if nxt <= start:
+                    self._save(complete=True)
+                    self.done = True
+                    return True
+                self.offsets.append(nxt)
+                if len(self.offsets.tail) >= TAIL_MAX:
+                    self._save()
+                if time.ticks_diff(deadline, time.ticks_ms()) <= 0 or (stop and stop()):
+                    return False
+        finally:
+            restore_book(saved)
+    def _save(self, complete=False):
+        # keep a reading position from an older index of this book
+        idx = index_file(self.book)
+        old = read_index_header(idx)
+        write_index(idx, self.book, self.offsets, old[4] if old else 0, complete)
+    def suspend(self):
+        # a prefix of the pages is a valid index (not marked complete, so the
+        # book is queued again and the next job carries on from it)
+        if self.offsets is not None and len(self.offsets) > 1:
+            saved = use_book(self.book)
+            try:
+                self._save()
+            finally:
+                restore_book(saved)
+def ingest_scan():
+    global ingest_queue, ingest_scanned
+    ingest_scanned = time.ticks_ms()
+    storage.clean_orphans(BOOK_DIR)
+    if CACHE_QUOTA is not None and storage.cache_bytes() >= CACHE_QUOTA:
+        ingest_queue = []  # caches are only evicted when a book is opened
+        return
+    files = get_text_files(BOOK_DIR)
+    reading = text_file.rsplit(".", 1)[0]
+    free = storage.free_bytes()
+    todo = []
+    for name in files:
+        path = f"{BOOK_DIR}/{name}"
+        base = path.rsplit(".", 1)[0]
+        if base == reading:
+            continue  # the open book looks after itself
+        if name.endswith(".epub"):
+            if name[:-5] + glyphtext.EXT not in files and name[:-5] + pagebook.EXT not in files:
+                if free > no_space.get(path, -1) and convert_failed.get(path) != os.stat(path)[6]:
+                    todo.append(path)
+        elif name.endswith((".txt", glyphtext.EXT)):
+            if not index_current(index_file(path), path):
+                todo.append(path)
+    current = text_file.split("/")[-1]
+    todo.sort(key=lambda p: (p.split("/")[-1] <= current, p))
+    ingest_queue = todo
+def ingest_drop(book):
+    """Forget queued work on book (it is being opened)."""
+    global ingest_job
+    base = book.rsplit(".", 1)[0]
+    ingest_queue[:] = [p for p in ingest_queue if p.rsplit(".", 1)[0] != base]
+    job = ingest_job
+    if job is None:
+        return
+    job_book = job.book if isinstance(job, IndexJob) else job.epub_path
+    if job_book.rsplit(".", 1)[0] == base:
+        job.suspend()
+        ingest_job = None
+def ingest_suspend():
+    global ingest_job
+    if ingest_job:
+        ingest_job.suspend()
+        if isinstance(ingest_job, IndexJob):
+            ingest_job = None
+def ingest_step():
+    """One slice of background work on other books."""
+    global ingest_job
+    if ingest_job is None:
+        if not ingest_queue:
+            if time.ticks_diff(time.ticks_ms(), ingest_scanned) >= INGEST_RESCAN_MS:
+                ingest_scan()
+            return
+        book = ingest_queue.pop(0)
+        if book.endswith(".epub"):
+            # background work never evicts other books' caches to make room
+            ingest_job = ExtractionJob(book, state_file=book_state_file(book, ".job"), allow_evict=False)
+        else:
+            ingest_job = IndexJob(book)
+    job = ingest_job
+    if job.step(stop=button_pressed):
+        ingest_job = None
+        if isinstance(job, ExtractionJob) and job.no_space:
+            no_space[job.epub_path] = storage.free_bytes()
+        elif isinstance(job, ExtractionJob) and not job.ok:
+            conversion_failed(job)
+        if isinstance(job, ExtractionJob) and job.ok:
+            converted(job)
+            ingest_queue.insert(0, job.out_path)
 # ---------------- PAGE RENDERER -----------------
+@memstat.measured("render")
 def render_page(start_offset, draw=True, remainder=b""):
     if draw:
         display.set_pen(15)
         display.clear()
+    glyph = text_file.endswith((glyphtext.EXT, ".epub", pagebook.EXT))
+    draw_line = prnt_glyphs if glyph else prnt
+    sep = b" " if glyph else " "
     y = 0
     lines = 0
     next_offset = -1
     try:
-        with open(text_file, "rb") as f:
-            f.seek(start_offset)
-            while lines < LINES_PER_PAGE:
-                pos = f.tell()
-                if remainder:
-                    line_bytes = remainder
-                    f.seek(start_offset + len(remainder))
-                    remainder = b""
-                else:
-                    line_bytes = f.readline()
-                if not line_bytes:
+        f = book_file()
+        f.seek(start_offset)
+        if book_end >= 0:
+            # .pgb: lines are already wrapped, just draw them
+            while lines < LINES_PER_PAGE and f.tell() < book_end:
+                line = f.readline().rstrip(b"\n")
+                if draw and line: prnt_glyphs(line, TEXT_PADDING, y)
+                if draw: y += LINE_HEIGHT
+                lines += 1
+            next_offset = f.tell() if f.tell() < book_end else start_offset
+        while next_offset == -1 and lines < LINES_PER_PAGE:
+            pos = f.tell()
+            if remainder:
+                line_bytes = remainder
+                f.seek(start_offset + len(remainder))
+                remainder = b""
+            else:
+                line_bytes = f.readline()
+            if not line_bytes:
+                next_offset = f.tell()
+                break
+            line = line_bytes.rstrip(b"\r\n")
+            if not line:
+                if draw: y += LINE_HEIGHT
+                lines += 1
+                if lines >= LINES_PER_PAGE:
                     next_offset = f.tell()
                     break
-                line = line_bytes.rstrip(b"\r\n")
-                if not line:
-                    if draw: y += LINE_HEIGHT
-                    lines += 1
-                    if lines >= LINES_PER_PAGE:
-                        next_offset = f.tell()
-                        break
-                    continue
+                continue
+            if glyph:
+                words = line.split(b" ")
+            else:
                 try:
                     line_str = line.decode("utf-8", "ignore")
                 except:
                     line_str = line.decode("latin-1", "ignore")
                 words = line_str.replace("…", "...").split(" ")
-                current = ""
-                byte_idx = 0
-                for i, word in enumerate(words):
-                    if not word:
-                        byte_idx += 1
-                        continue
-                    appended = current + " " + word if current else word
-                    if len(appended) <= MAX_CHARS:
-                        current = appended
-                        byte_idx += len(word.encode("utf-8")) + (1 if i < len(words)-1 else 0)
-                    else:
-                        if draw: prnt(current, TEXT_PADDING, y)
-                        if draw: y += LINE_HEIGHT
-                        lines += 1
-                        if lines >= LINES_PER_PAGE:
-                            remainder = line_bytes[byte_idx:]
-                            next_offset = pos + byte_idx
-                            break
-                        current = word
-                        byte_idx += len(word.encode("utf-8")) + (1 if i < len(words)-1 else 0)
-                if next_offset != -1: break
-                if current:
-                    if draw: prnt(current, TEXT_PADDING, y)
+            current = sep[:0]
+            current_px = 0
+            byte_idx = 0
+            for i, word in enumerate(words):
+                if not word:
+                    byte_idx += 1
+                    continue
+                appended = current + sep + word if current else word
+                word_bytes = len(word) if glyph else len(word.encode("utf-8"))
+                # running pixel width of the line, so each word is measured once
+                word_px = font.measure(word)
+                appended_px = current_px + SPACE_PX + word_px if current else word_px
+                if appended_px <= TEXT_WIDTH:
+                    current = appended
+                    current_px = appended_px
+                    byte_idx += word_bytes + (1 if i < len(words)-1 else 0)
+                else:
+                    if draw: draw_line(current, TEXT_PADDING, y)
                     if draw: y += LINE_HEIGHT
                     lines += 1
-                if lines >= LINES_PER_PAGE:
-                    next_offset = f.tell()
-                    break
-            if next_offset == -1:
+                    if lines >= LINES_PER_PAGE:
+                        remainder = line_bytes[byte_idx:]
+                        next_offset = pos + byte_idx
+                        break
+                    current = word
+                    current_px = word_px
+                    byte_idx += word_bytes + (1 if i < len(words)-1 else 0)
+            if next_offset != -1: break
+            if current:
+                if draw: draw_line(current, TEXT_PADDING, y)
+                if draw: y += LINE_HEIGHT
+                lines += 1
+            if lines >= LINES_PER_PAGE:
                 next_offset = f.tell()
+                break
+        if next_offset == -1:
+            next_offset = f.tell()
     except:
         return start_offset, b""
     if draw:
@@ -217,21 +763,206 @@ def render_page(start_offset, draw=True, remainder=b""):
         display.set_font("bitmap8")
         display.text(f"{percent}", 287, 0, WIDTH, 1.0)
         try:
-            file_size = os.stat(text_file)[6]
+            file_size = book_end if book_end >= 0 else blockzip.size_of(book_file())
             progress = (start_offset + 1)/file_size
             display.rectangle(0, 127, int(progress*WIDTH), 1)
         except:
             pass
     return next_offset, remainder
+# ---------------- SEARCH -----------------
+SEARCH_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789 .,'-"
+SEARCH_MAX_HITS = 50
+SEARCH_REDRAW_MS = 2000    # e-ink is slow, refresh the hit list at most this often
+def read_query():
+    """Spell a query: up/down pick a letter, C adds it, B deletes, A searches."""
+    query = ""
+    ci = 0
+    changed = True
+    while True:
+        if changed:
+            display.set_pen(15)
+            display.clear()
+            prnt("find: " + query + "_", 0, 0)
+            display.line(0, 16, badger2040.WIDTH, 16)
+            first = max(0, min(ci - MAX_CHARS // 2, len(SEARCH_CHARS) - MAX_CHARS))
+            x = TEXT_PADDING
+            for i in range(first, min(len(SEARCH_CHARS), first + MAX_CHARS)):
+                g = ord(SEARCH_CHARS[i])
+                if i == ci:
+                    display.set_pen(0)
+                    display.rectangle(x - 1, LIST_START_Y - 1, font.WIDTH + 2, font.HEIGHT + 2)
+                character(g, x, LIST_START_Y, pen_color=15 if i == ci else 0)
+                x += font.WIDTH
+            display.set_pen(0)
+            display.set_font("bitmap8")
+            display.text("up/down: letter  c: add  b: delete  a: search", 0, 120, WIDTH, 1.0)
+            display.update()
+            changed = False
+        if display.pressed(badger2040.BUTTON_UP):
+            ci = (ci - 1) % len(SEARCH_CHARS); changed = True
+        if display.pressed(badger2040.BUTTON_DOWN):
+            ci = (ci + 1) % len(SEARCH_CHARS); changed = True
+        if display.pressed(badger2040.BUTTON_C):
+            query += SEARCH_CHARS[ci]; changed = True
+        if display.pressed(badger2040.BUTTON_B):
+            if not query:
+                return ""
+            query = query[:-1]; changed = True
+        if display.pressed(badger2040.BUTTON_A):
+            return query.strip()
+        time.sleep(0.05)
+def draw_hits(query, hits, selected, searching):
+    display.set_pen(15)
+    display.clear()
+    status = "..." if searching else f" ({len(hits)})"
+    prnt("find: " + query + status, 0, 0)
+    display.line(0, 16, badger2040.WIDTH, 16)
+    if not hits:
+        prnt("searching..." if searching else "not found", 5, LIST_START_Y)
+        display.update()
+        return
+    glyph = text_file.endswith((glyphtext.EXT, ".epub", pagebook.EXT))
+    max_items = (badger2040.HEIGHT - LIST_START_Y) // LINE_HEIGHT
+    start_index = max(0, selected - max_items + 1)
+    f = book_file()
+    y = LIST_START_Y
+    for i in range(start_index, min(len(hits), start_index + max_items)):
+        offset, page = hits[i]
+        f.seek(max(0, offset - 6))
+        context = f.read(MAX_CHARS).replace(b"\r", b" ").replace(b"\n", b" ")
+        label = f"{page + 1}: "
+        if i == selected:
+            display.set_pen(0)
+            display.rectangle(0, y - 1, badger2040.WIDTH, LINE_HEIGHT + 2)
+        pen = 15 if i == selected else 0
+        prnt(label, TEXT_PADDING, y, pen_color=pen)
+        x = TEXT_PADDING + font.measure(label)
+        if glyph:
+            prnt_glyphs(context, x, y, pen_color=pen)
+        else:
+            prnt(context.decode("utf-8", "ignore"), x, y, pen_color=pen)
+        y += LINE_HEIGHT
+    display.update()
+def search_book():
+    """Search the open book; returns the page of the chosen hit or None. B stops the scan, then leaves."""
+    query = read_query()
+    if not query:
+        return None
+    if page_offsets[0] > 0:
+        # hits before a partial index need the pages in front of it
+        state["current_page"] = reflow(page_offsets[state["current_page"]])
+    glyph = text_file.endswith((glyphtext.EXT, ".epub", pagebook.EXT))
+    pattern = glyphtext.encode(query) if glyph else query.encode("utf-8")
+    start = page_offsets[0] if book_end >= 0 else 0
+    searcher = booksearch.Searcher(book_file(), pattern, start, book_end if book_end >= 0 else None)
+    hits = []
+    selected = 0
+    changed = True
+    drawn = time.ticks_add(time.ticks_ms(), -SEARCH_REDRAW_MS)
+    while True:
+        if not searcher.done:
+            for offset in searcher.step():
+                hits.append((offset, page_for_offset(offset)))
+                changed = True
+            if len(hits) >= SEARCH_MAX_HITS:
+                searcher.cancel()
+            if searcher.done:
+                changed = True
+        if changed and (searcher.done or (hits and time.ticks_diff(time.ticks_ms(), drawn) >= SEARCH_REDRAW_MS)):
+            draw_hits(query, hits, selected, not searcher.done)
+            drawn = time.ticks_ms()
+            changed = False
+        if display.pressed(badger2040.BUTTON_UP) and selected > 0:
+            selected -= 1; changed = True
+        if display.pressed(badger2040.BUTTON_DOWN) and selected < len(hits) - 1:
+            selected += 1; changed = True
+        if display.pressed(badger2040.BUTTON_A) and hits:
+            searcher.cancel()
+            return hits[selected][1]
+        if display.pressed(badger2040.BUTTON_B):
+            if searcher.done:
+                return None
+            searcher.cancel()
+            changed = True
+            while display.pressed(badger2040.BUTTON_B):
+                time.sleep(0.05)
+        if searcher.done:
+            time.sleep(0.05)
+def goto_page(page):
+    """Show page now and prerender the one after it."""
+    global remainder
+    state["current_page"] = page
+    remainder = page_remainders.get(page, b"")
+    next_offset, rem_next = render_page(page_offsets[page], draw=True, remainder=remainder)
+    display.update(); display.update()
+    remember_screen()
+    if page + 1 == len(page_offsets) and next_offset > page_offsets[page]:
+        page_offsets.append(next_offset)
+        page_remainders[page + 1] = rem_next
+    if page + 1 < len(page_offsets):
+        render_page(page_offsets[page + 1], draw=True, remainder=page_remainders.get(page + 1, b""))
+    prune_remainders(page)
+    save_index(INDEX_FILE)
+    state_save(state)
+# ---------------- BOOK SESSIONS -----------------
+# books switched away from stay in RAM (booksessions.py) for a one-refresh switch back
+sessions = booksessions.SessionCache()
+def keep_session():
+    """Put the open book's state in sessions; call after save_index()."""
+    if not state.get("last_book") or not len(page_offsets):
+        return
+    page = min(state["current_page"], len(page_offsets) - 1)
+    frame = None
+    if screen_at == (text_file, page_offsets[page]) and sessions.room_for_frame(len(screen_copy)):
+        frame = bytes(screen_copy)
+    sessions.put(booksessions.Session(text_file, layout_key(), page_offsets, page_remainders,
+                                      book_end, page, book_fingerprint(text_file), frame, pgb_body))
+def with_heap(fn, *args):
+    """fn(*args); if it runs out of heap, drop the kept sessions and try once more."""
+    try:
+        return fn(*args)
+    except MemoryError:
+        print("out of memory, dropping book sessions")
+        sessions.clear()
+        gc.collect()
+        return fn(*args)
+def resume_session():
+    """Carry on reading text_file from its session, one refresh; False if it has none."""
+    global page_offsets, page_remainders, book_end, fingerprint_cache, remainder
+    s = sessions.take(text_file, layout_key(), index_anchor)
+    if s is None:
+        return False
+    page_offsets, page_remainders, book_end = s.offsets, s.remainders, s.book_end
+    use_pgb_body(s.body)
+    fingerprint_cache = (text_file, s.fingerprint)
+    page = s.page
+    state["current_page"] = page
+    remainder = page_remainders.get(page, b"")
+    if s.frame is not None:
+        display_fb[:] = s.frame
+    else:
+        render_page(page_offsets[page], draw=True, remainder=remainder)
+    display.update()
+    remember_screen()
+    if page + 1 == len(page_offsets):
+        next_offset, rem_next = render_page(page_offsets[page], draw=False, remainder=remainder)
+        if next_offset > page_offsets[page]:
+            page_offsets.append(next_offset)
+            page_remainders[page + 1] = rem_next
+    if page + 1 < len(page_offsets):
+        render_page(page_offsets[page + 1], draw=True, remainder=page_remainders.get(page + 1, b""))
+    state_save(state)
+    return True
 # ---------------- FILE PICKER -----------------
 LIST_LINE_HEIGHT = LINE_HEIGHT
 LIST_START_Y = 10 + 16 + 4
 HEADER_TEXT = "choose book :"
-# ---- UPDATED: show .txt *and* .epub ----
+# ---- UPDATED: show .txt, .gtx, .pgb *and* .epub ----
+BOOK_EXTS = (".txt", glyphtext.EXT, pagebook.EXT, ".epub")
 def get_text_files(directory):
     try:
         all_files = os.listdir(directory)
-        return sorted([f for f in all_files if f.endswith(".txt") or f.endswith(".epub")])
+        return sorted([f for f in all_files if f.endswith(BOOK_EXTS)])
     except OSError:
         return []
 def draw_file_list(files, selected_index):
@@ -287,31 +1018,43 @@ state = state_load()
 text_file = state.get("last_book") or None
 if not text_file:
     text_file = "Error: Not Set"
-INDEX_FILE = "/state/" + text_file.replace("/", "_").replace(".", "_") + ".idx"
-if index_exists(INDEX_FILE):
-    load_index(INDEX_FILE)
+INDEX_FILE = index_file(text_file)
+if state.get("last_book"):
+    storage.touch(text_file)
+position = load_book_index(INDEX_FILE)
+if position >= 0:
+    current = page_at(position)
 else:
-    page_offsets = [0]
-    page_remainders = {}
-    save_index(INDEX_FILE)
-current = state.get("current_page", 0)
-current = min(current, len(page_offsets)-1)
-remainder = page_remainders.get(current, b"")
-next_offset, remainder = render_page(page_offsets[current], draw=True, remainder=remainder)
-page_remainders[current] = remainder
-prune_remainders(current)
-next_page = current + 1
-if next_page == len(page_offsets):
-    next_offset, rem_next = render_page(page_offsets[current], draw=False, remainder=remainder)
-    if next_offset > page_offsets[current]:
-        page_offsets.append(next_offset)
-        page_remainders[next_page] = rem_next
-        prune_remainders(current)
-        save_index(INDEX_FILE)
+    current = min(state.get("current_page", 0), len(page_offsets)-1)
+state["current_page"] = current
+resume = resume_load()
+if (resume and resume["book"] == text_file and resume["font"] == (font.path or "")
+        and resume["page"] == current and page_offsets[current] == resume["offset"]):
+    # waking from halt: the panel still shows this page, only prerender the next one
+    next_page = current + 1
+    if resume["next_offset"] > page_offsets[current]:
+        if next_page == len(page_offsets):
+            page_offsets.append(resume["next_offset"])
+        page_remainders[next_page] = resume["next_remainder"]
+else:
+    remainder = page_remainders.get(current, b"")
+    next_offset, remainder = render_page(page_offsets[current], draw=True, remainder=remainder)
+    page_remainders[current] = remainder
+    prune_remainders(current)
+    next_page = current + 1
+    if next_page == len(page_offsets):
+        next_offset, rem_next = render_page(page_offsets[current], draw=False, remainder=remainder)
+        if next_offset > page_offsets[current]:
+            page_offsets.append(next_offset)
+            page_remainders[next_page] = rem_next
+            prune_remainders(current)
+            save_index(INDEX_FILE)
 if next_page < len(page_offsets):
     render_page(page_offsets[next_page], draw=True, remainder=page_remainders.get(next_page, b""))
+start_extraction_job()
 # ---------------- MAIN LOOP -----------------
 FAST_ADVANCE_PAGES = 50
+buttontrace.start(TRACE, display, globals())
 while True:
     display.keepalive()
     # NEXT PAGE
@@ -323,6 +1066,7 @@ while True:
         last = time.ticks_ms()
         display.led(50)
         if press_duration > 700:
+            memstat.begin("fast_advance")
             target_page = state["current_page"] + FAST_ADVANCE_PAGES
             current = state["current_page"]
             last_remainder = page_remainders.get(current, b"")
@@ -338,7 +1082,7 @@ while True:
                     _, rem_next = render_page(page_offsets[current], draw=False, remainder=last_remainder)
                     last_remainder = rem_next
                 current = next_page
-                gc.collect()
+                memstat.collect()
                 prune_remainders(current)
                 if current >= target_page:
                     break
@@ -355,18 +1099,21 @@ while True:
             render_page(page_offsets[current], draw=True, remainder=last_remainder)
             display.update(); display.update()
             state["current_page"] = current
-            gc.collect()
+            remember_screen()
+            memstat.collect()
+            memstat.end("fast_advance")
         else:
             display.update(); display.update()
             current = state["current_page"] + 1
             if current >= len(page_offsets):
                 current = len(page_offsets)-1
             state["current_page"] = current
+            remember_screen()
             remainder = page_remainders.get(current, b"")
             next_page = current + 1
             if next_page == len(page_offsets):
                 next_offset, rem_next = render_page(page_offsets[current], draw=False, remainder=remainder)
-                gc.collect()
+                memstat.collect()
                 if next_offset > page_offsets[current]:
                     page_offsets.append(next_offset)
                     page_remainders[next_page] = rem_next
@@ -374,15 +1121,29 @@ while True:
                 render_page(page_offsets[next_page], draw=True, remainder=page_remainders.get(next_page, b""))
             prune_remainders(current)
         display.led(0)
-    # PREVIOUS PAGE
+    # PREVIOUS PAGE (long press: search)
     if display.pressed(badger2040.BUTTON_UP):
+        press_start = time.ticks_ms()
+        while display.pressed(badger2040.BUTTON_UP):
+            time.sleep(0.05)
         last = time.ticks_ms()
+        if time.ticks_diff(last, press_start) > 1000:
+            page = search_book()
+            if page is None:
+                page = state["current_page"]
+            goto_page(page)
+            last = time.ticks_ms()
+            continue
         display.led(50)
-        current = max(0, state["current_page"] - 1)
+        if state["current_page"] == 0 and page_offsets[0] > 0:
+            current = fill_front()
+        else:
+            current = max(0, state["current_page"] - 1)
         state["current_page"] = current
         remainder = page_remainders.get(current, b"")
         render_page(page_offsets[current], draw=True, remainder=remainder)
         display.update(); display.update()
+        remember_screen()
         next_page = current + 1
         if next_page < len(page_offsets):
             render_page(page_offsets[next_page], draw=True, remainder=page_remainders.get(next_page, b""))
@@ -393,6 +1154,12 @@ while True:
     if display.pressed(badger2040.BUTTON_A):
         save_index(INDEX_FILE)
         state_save(state)
+        # the open book's inflaters are freed first, so the heap checks see what is left for sessions
+        close_book()
+        if extract_job:
+            extract_job.suspend()
+        ingest_suspend()
+        keep_session()
         new_book = file_picker()
         if not new_book:
             continue
@@ -410,63 +1177,25 @@ while True:
         tf = norm_path(text_file)
         same_book = nb == tf
         # ---- EPUB HANDLING ----
+        # read a converted copy if there is one, otherwise the EPUB itself
         if new_book.lower().endswith(".epub"):
-            display.set_pen(15)
-            display.clear()
-            prnt("Extracting EPUB...", 10, 50)
-            display.update(); display.update()
-            # Turn on LED to indicate extraction is in progress
-            display.led(50)
-           
-            # Pass the full path directly to the extractor
-            ok = run_extraction(new_book)
-           
-            # Turn off LED when extraction is complete
-            display.led(0)
-            if not ok:
-                display.set_pen(15)
-                display.clear()
-                prnt("Extraction failed!", 10, 50)
-                display.update(); display.update()
-                time.sleep(2)
-                continue
-            # The extracted .txt file will be in /books/
-            txt_name = new_book[:-5] + ".txt"
-            new_book = txt_name
-        INDEX_FILE = "/state/" + new_book.replace("/", "_").replace(".", "_") + ".idx"
+            for ext in (pagebook.EXT, glyphtext.EXT):
+                if index_exists(new_book[:-5] + ext):
+                    new_book = new_book[:-5] + ext
+                    break
         if same_book:
-            state = state_load()
-            current = min(state.get("current_page", 0), len(page_offsets)-1)
-            remainder = page_remainders.get(current, b"")
-            render_page(page_offsets[current], draw=True, remainder=remainder)
-            display.update();display.update()
+            if not with_heap(resume_session):
+                goto_page(min(state["current_page"], len(page_offsets)-1))
             continue
         text_file = new_book
+        INDEX_FILE = index_file(text_file)
         state["last_book"] = text_file
-        state_save(state)
-        if index_exists(INDEX_FILE):
-            load_index(INDEX_FILE)
-            state = state_load()
-            current = min(state.get("current_page", 0), len(page_offsets)-1)
-            remainder = page_remainders.get(current, b"")
-            render_page(page_offsets[current], draw=True, remainder=remainder)
-            display.update();display.update()
-        else:
-            page_offsets = [0]
-            page_remainders = {}
-            state["current_page"] = 0
-            state_save(state)
-            remainder = b""
-            next_offset, remainder = render_page(page_offsets[0], draw=True, remainder=remainder)
-            page_remainders[0] = remainder
-            prune_remainders(0)
-            next_offset2, rem_next2 = render_page(page_offsets[0], draw=False, remainder=remainder)
-            if next_offset2 > page_offsets[0]:
-                page_offsets.append(next_offset2)
-                page_remainders[1] = rem_next2
-                prune_remainders(0)
-                save_index(INDEX_FILE)
-            display.update(); display.update()
+        storage.touch(text_file)
+        if CACHE_QUOTA is not None:
+            storage.evict(0, keep=(text_file,) + sessions.books(), quota=CACHE_QUOTA)
+        with_heap(start_extraction_job)
+        if not with_heap(resume_session):
+            with_heap(lambda: goto_page(page_at(max(0, load_book_index(INDEX_FILE)))))
     # BUTTON_B short press
     if display.pressed(badger2040.BUTTON_B):
         press_start = time.ticks_ms()
@@ -475,13 +1204,67 @@ while True:
             display.keepalive()
             time.sleep(0.05)
             if time.ticks_diff(time.ticks_ms(), press_start) > 1000:
+                # long press: next font, keeping the reading position
                 display.led(50)
+                fonts = font_files()
+                if fonts:
+                    path = font.path
+                    path = fonts[(fonts.index(path) + 1) % len(fonts)] if path in fonts else fonts[0]
+                    offset = page_offsets[state["current_page"]]
+                    if pgb_body:
+                        offset += pgb_body[0]  # .pgb file offset, whichever way it is read
+                    save_index(INDEX_FILE)
+                    font.close()
+                    set_font(load_font(path))
+                    sessions.clear()  # paginated for the old font
+                    try:
+                        with open(FONT_STATE, "w") as f:
+                            f.write(path)
+                    except OSError as e:
+                        print("font save failed:", e)
+                    INDEX_FILE = index_file(text_file)
+                    load_book_index(INDEX_FILE)
+                    if pgb_body:
+                        offset = max(0, offset - pgb_body[0])
+                    current = page_at(offset)
+                    state["current_page"] = current
+                    save_index(INDEX_FILE)
+                    state_save(state)
+                    remainder = page_remainders.get(current, b"")
+                    next_offset, rem_next = render_page(page_offsets[current], draw=True, remainder=remainder)
+                    display.update(); display.update()
+                    remember_screen()
+                    if current + 1 == len(page_offsets) and next_offset > page_offsets[current]:
+                        page_offsets.append(next_offset)
+                        page_remainders[current + 1] = rem_next
+                    if current + 1 < len(page_offsets):
+                        render_page(page_offsets[current + 1], draw=True, remainder=page_remainders.get(current + 1, b""))
                 display.led(0)
                 break
+    # BACKGROUND EXTRACTION, then other books
+    if time.ticks_diff(time.ticks_ms(), last) > IDLE_BEFORE_WORK:
+        if extract_job:
+            if extract_job.step(stop=button_pressed):
+                adopt_extracted_book()
+        else:
+            ingest_step()
     # SLEEP
     if time.ticks_diff(time.ticks_ms(), last) > INACTIVITY_TIMEOUT:
         display.led(50)
         save_index(INDEX_FILE)
         state_save(state)
+        close_book()
+        if extract_job:
+            extract_job.suspend()
+        ingest_suspend()
+        current = state["current_page"]
+        has_next = current + 1 < len(page_offsets)
+        resume_save(text_file, font.path, current, page_offsets[current],
+                    page_offsets[current + 1] if has_next else -1,
+                    page_remainders.get(current + 1, b"") if has_next else b"")
+        buttontrace.flush()
         display.halt()
+        # still running on USB power: the panel may change before the next halt
+        resume_clear()
+        last = time.ticks_ms()
     time.sleep(0.05)
@@ -0,0 +1,147 @@
+# ------------------------------------------------------------
+# memstat.py  –  heap and GC bookkeeping per operation
+# ------------------------------------------------------------
+# Wrap an operation with begin(name)/end(name) or decorate it with
+# @measured(name); while ENABLED, every call records the heap allocated
+# across it, the heap high-water mark, the lowest free heap seen and the
+# collections that ran.  memstat.dump() at the REPL prints the table.
+# @measured only wraps functions defined while ENABLED, so call enable()
+# before importing the modules to measure; otherwise they run bare.
+#
+# Host runs: set STRICT and give an operation a budget(name, bytes) to
+# turn an allocation regression into an AssertionError.  The delta is
+# only exact while the collector is off (gc.disable()).
+import gc
+
+try:
+    import tracemalloc     # CPython only, stands in for gc.mem_alloc()
+except ImportError:
+    tracemalloc = None
+
+ENABLED = False
+STRICT = False
+
+# name -> [calls, collections, largest delta, last delta, peak alloc, lowest free]
+_stats = {}
+_open = {}         # name -> (alloc, collections) when it began
+_budgets = {}      # name -> max bytes allocated per call
+_collections = 0
+_peak = 0
+
+
+def _alloc() -> int:
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    if tracemalloc and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def _free() -> int:
+    return gc.mem_free() if hasattr(gc, "mem_free") else 0
+
+
+def enable(strict=False):
+    global ENABLED, STRICT
+    ENABLED = True
+    STRICT = strict
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    global _collections, _peak
+    _stats.clear()
+    _open.clear()
+    _collections = 0
+    _peak = 0
+
+
+def budget(name, max_bytes):
+    """Fail end(name) when STRICT and one call allocated more than max_bytes."""
+    _budgets[name] = max_bytes
+
+
+def sample():
+    """Note the current heap use; call inside long operations to catch their peak."""
+    global _peak
+    a = _alloc()
+    if a > _peak:
+        _peak = a
+    for name in _open:
+        s = _stats[name]
+        if a > s[4]:
+            s[4] = a
+    return a
+
+
+def collect():
+    """gc.collect() that is counted against the open operations."""
+    global _collections
+    if ENABLED:
+        sample()
+        _collections += 1
+    gc.collect()
+
+
+def begin(name):
+    if not ENABLED:
+        return
+    if name not in _stats:
+        _stats[name] = [0, 0, 0, 0, 0, 1 << 30]
+    _open[name] = (sample(), _collections)
+
+
+def end(name):
+    if not ENABLED or name not in _open:
+        return
+    a = sample()
+    a0, c0 = _open.pop(name)
+    s = _stats[name]
+    delta = a - a0
+    s[0] += 1
+    s[1] += _collections - c0
+    s[3] = delta
+    if delta > s[2]:
+        s[2] = delta
+    free = _free()
+    if free and free < s[5]:
+        s[5] = free
+    limit = _budgets.get(name)
+    if STRICT and limit is not None and delta > limit:
+        raise AssertionError(f"{name} allocated {delta} bytes, budget {limit}")
+
+
+def measured(name):
+    """Decorator: begin(name)/end(name) around every call of the function, if enabled by now."""
+    def wrap(f):
+        if not ENABLED:
+            return f  # no wrapper, so no argument tuple per call
+        def call(*args, **kwargs):
+            begin(name)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                end(name)
+        return call
+    return wrap
+
+
+def stats(name):
+    """(calls, collections, largest delta, last delta, peak alloc, lowest free) or None."""
+    s = _stats.get(name)
+    if not s:
+        return None
+    return tuple(s[:5]) + (s[5] if s[5] != 1 << 30 else 0,)
+
+
+def dump():
+    print(f"heap peak {_peak} B, free now {_free()} B, {_collections} collections")
+    print("operation        calls   gc   max delta  last delta   peak alloc  min free")
+    for name in sorted(_stats):
+        calls, gcs, big, last, peak, low = _stats[name]
+        low = low if low != 1 << 30 else 0
+        print(f"{name:<16}{calls:>6}{gcs:>5}{big:>12}{last:>12}{peak:>13}{low:>10}")
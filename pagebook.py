@@ -0,0 +1,192 @@
+# ------------------------------------------------------------
+# pagebook.py  –  pre-paginated glyph books (.pgb)
+# ------------------------------------------------------------
+# Layout:
+#   header   "BPG1", u8 max_chars, u8 lines_per_page, u16 reserved
+#   body     glyph text already wrapped, one "\n"-terminated line per
+#            display line, lines_per_page lines per page
+#   table    u32 offset of the first line of every page
+#   trailer  u32 page count, u32 table offset, "BPG1"
+# The page table goes at the end so the file can be produced in one
+# streaming pass; the trailer has a fixed size so it is found by seeking
+# back from the end.
+import struct
+from array import array
+from blockzip import open_book
+from pageindex import PageIndex
+
+EXT = ".pgb"
+MAGIC = b"BPG1"
+HEADER_FMT = "<4sBBH"
+HEADER_SIZE = 8
+TRAILER_FMT = "<II4s"
+TRAILER_SIZE = 12
+
+
+class PageWriter:
+    """Wrap a glyph text stream to max_chars x lines_per_page and write it as .pgb."""
+    def __init__(self, out, max_chars, lines_per_page):
+        self.out = out                # BlockWriter-like: write(), tell(), flush()
+        self.max_chars = max_chars
+        self.lines_per_page = lines_per_page
+        # the input line being wrapped: output line so far, and the word after it
+        self.cur = bytearray(max_chars + 1)
+        self.cur_len = 0
+        self.word = bytearray(max_chars + 1)
+        self.word_len = 0
+        self.seen = 0                 # bytes of the input line so far (0: an empty line)
+        self.lines = 0                # lines already on the current page
+        self.pages = array("I")
+        self.chapters = []            # first page of each member
+        out.write(struct.pack(HEADER_FMT, MAGIC, max_chars, lines_per_page, 0))
+
+    def tell(self):
+        return self.out.tell()
+
+    def mark_chapter(self):
+        self.chapters.append(len(self.pages) if self.lines == 0 else len(self.pages) - 1)
+
+    def write(self, data):
+        # data may be a memoryview of the caller's buffer: it is read byte by
+        # byte into the line buffers, never copied whole
+        word = self.word
+        wl = self.word_len
+        seen = self.seen
+        for b in data:
+            if b == 10:
+                self.word_len = wl
+                self._end_word()
+                wl = 0
+                if not seen:
+                    self._emit(b'')
+                elif self.cur_len:
+                    self._emit(memoryview(self.cur)[:self.cur_len])
+                self.cur_len = 0
+                seen = 0
+            elif b == 32:
+                seen += 1
+                if wl:
+                    self.word_len = wl
+                    self._end_word()
+                    wl = 0
+            else:
+                seen += 1
+                if wl == len(word):
+                    word.extend(bytes(len(word)))  # a word wider than a line
+                word[wl] = b
+                wl += 1
+        self.word_len = wl
+        self.seen = seen
+        return len(data)
+
+    def _end_word(self):
+        # same greedy wrap as main.render_page(), so page numbers agree
+        wl = self.word_len
+        if not wl:
+            return
+        self.word_len = 0
+        n = self.cur_len
+        if n and n + 1 + wl > self.max_chars:
+            self._emit(memoryview(self.cur)[:n])
+            n = 0
+        elif not n and wl > self.max_chars:
+            self._emit(b'')
+        if n:
+            self.cur[n] = 32
+            n += 1
+        if n + wl > len(self.cur):
+            self.cur.extend(bytes(n + wl - len(self.cur)))
+        self.cur[n:n + wl] = memoryview(self.word)[:wl]
+        self.cur_len = n + wl
+
+    def _emit(self, text):
+        if self.lines == 0:
+            self.pages.append(self.out.tell())
+        self.out.write(text)
+        self.out.write(b"\n")
+        self.lines += 1
+        if self.lines == self.lines_per_page:
+            self.lines = 0
+
+    def flush(self):
+        self.out.flush()
+
+    def close(self):
+        if self.seen:
+            self.write(b"\n")
+        table_offset = self.out.tell()
+        for off in self.pages:
+            self.out.write(struct.pack("<I", off))
+        self.out.write(struct.pack(TRAILER_FMT, len(self.pages), table_offset, MAGIC))
+        self.out.close()
+
+
+class BodyView:
+    """
+    The text body of a .pgb as a file of its own: offsets start at 0 and
+    end with the body, so a reader can wrap it again for another layout.
+    """
+    def __init__(self, f, start, end):
+        self.f = f
+        self.start = start
+        self.size = end - start
+        self.pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, min(offset, self.size))
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size < 0 or self.pos + size > self.size:
+            size = self.size - self.pos
+        if size <= 0:
+            return b""
+        self.f.seek(self.start + self.pos)
+        data = self.f.read(size)
+        self.pos += len(data)
+        return data
+
+    def readline(self):
+        if self.pos >= self.size:
+            return b""
+        self.f.seek(self.start + self.pos)
+        line = self.f.readline()
+        if len(line) > self.size - self.pos:
+            line = line[:self.size - self.pos]
+        self.pos += len(line)
+        return line
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_layout(path):
+    """Return (max_chars, lines_per_page, page offsets (a PageIndex), body end) or None if not a .pgb."""
+    try:
+        with open_book(path) as f:
+            magic, max_chars, lines_per_page, _ = struct.unpack(HEADER_FMT, f.read(HEADER_SIZE))
+            if magic != MAGIC:
+                return None
+            f.seek(-TRAILER_SIZE, 2)
+            count, table_offset, magic = struct.unpack(TRAILER_FMT, f.read(TRAILER_SIZE))
+            if magic != MAGIC:
+                return None
+            # the page table is read from the book as it is needed
+            pages = PageIndex((), path, table_offset, count, open_book)
+            return max_chars, lines_per_page, pages, table_offset
+    except Exception as e:
+        print("read_layout failed:", e)
+    return None
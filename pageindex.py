@@ -0,0 +1,149 @@
+# ------------------------------------------------------------
+# pageindex.py  –  page start offsets of a book without all of them in RAM
+# ------------------------------------------------------------
+# The offsets of a paginated book live in a u32 table on flash (after the
+# header of an .idx, or at the end of a .pgb).  PageIndex reads that table
+# a segment of SEGMENT offsets at a time and keeps the last few segments
+# in a small LRU, plus the first offset of every segment as it learns them
+# (the sparse table that find() searches before opening a segment).
+# Offsets appended since the table was written stay in RAM in .tail until
+# save() appends them to the file, so memory doesn't grow with the book.
+#
+# len(), [i] (also negative), append() and find() are all main.py uses,
+# so a PageIndex stands in for the plain list of offsets it used to keep.
+import os
+from array import array
+
+SEGMENT = 256          # offsets per segment: 1 KB of flash
+CACHE_SEGMENTS = 4
+TAIL_MAX = 1024        # unsaved offsets worth appending to the file
+UNKNOWN = 0xFFFFFFFF
+
+
+def _open(path):
+    return open(path, "rb")
+
+
+def _last_at_or_before(a, offset) -> int:
+    """Binary search: index of the last entry of a at or before offset (0 if none)."""
+    lo, hi = 0, len(a)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[mid] <= offset:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+class PageIndex:
+    def __init__(self, offsets=(0,), path=None, base=0, count=0, opener=_open):
+        self.path = path       # file with the first count offsets as u32 from byte base
+        self.base = base
+        self.count = count
+        self.opener = opener
+        self.tail = array("I", offsets)
+        self.sparse = array("I")
+        self._grow_sparse()
+        self.cache = {}        # segment -> array of its offsets
+        self.order = []        # most recently used last
+        self.reads = 0         # segments read from flash so far
+
+    def _grow_sparse(self):
+        for _ in range(len(self.sparse), (self.count + SEGMENT - 1) // SEGMENT):
+            self.sparse.append(UNKNOWN)
+
+    def _read(self, first, n):
+        with self.opener(self.path) as f:
+            f.seek(self.base + 4 * first)
+            data = array("I", f.read(4 * n))
+        if len(data) != n:
+            raise OSError("page table truncated")
+        return data
+
+    def _segment(self, s):
+        data = self.cache.get(s)
+        if data is not None:
+            if self.order[-1] != s:
+                self.order.remove(s)
+                self.order.append(s)
+            return data
+        first = s * SEGMENT
+        data = self._read(first, min(SEGMENT, self.count - first))
+        self.reads += 1
+        self.sparse[s] = data[0]
+        if len(self.order) >= CACHE_SEGMENTS:
+            del self.cache[self.order.pop(0)]
+        self.cache[s] = data
+        self.order.append(s)
+        return data
+
+    def _first(self, s):
+        # the binary search over segments only needs their first offsets
+        off = self.sparse[s]
+        if off == UNKNOWN:
+            off = self.sparse[s] = self._read(s * SEGMENT, 1)[0]
+        return off
+
+    def __len__(self):
+        return self.count + len(self.tail)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count + len(self.tail)
+            if i < 0:
+                raise IndexError("page index out of range")
+        if i >= self.count:
+            return self.tail[i - self.count]
+        return self._segment(i // SEGMENT)[i % SEGMENT]
+
+    def append(self, offset):
+        self.tail.append(offset)
+
+    def find(self, offset) -> int:
+        """Last page starting at or before offset (0 if none)."""
+        if self.tail and (self.count == 0 or self.tail[0] <= offset):
+            return self.count + _last_at_or_before(self.tail, offset)
+        if self.count == 0:
+            return 0
+        lo, hi = 0, len(self.sparse)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self._first(mid) <= offset:
+                lo = mid
+            else:
+                hi = mid
+        return lo * SEGMENT + _last_at_or_before(self._segment(lo), offset)
+
+    def save(self, path, header):
+        """
+        Write header and every offset to path, which then backs the table.
+        If path already holds the table only the tail and header are written.
+        """
+        if path == self.path and self.base == len(header):
+            with open(path, "r+b") as f:
+                f.seek(self.base + 4 * self.count)
+                f.write(self.tail)
+                f.seek(0)
+                f.write(header)
+        else:
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(header)
+                for first in range(0, self.count, SEGMENT):
+                    f.write(self._read(first, min(SEGMENT, self.count - first)))
+                f.write(self.tail)
+            os.rename(tmp, path)
+            self.cache = {}
+            self.order = []
+        # the last segment may have been short; it is read again when needed
+        last = self.count // SEGMENT
+        if last in self.cache:
+            del self.cache[last]
+            self.order.remove(last)
+        self.path = path
+        self.base = len(header)
+        self.opener = _open
+        self.count += len(self.tail)
+        self.tail = array("I")
+        self._grow_sparse()
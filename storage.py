@@ -0,0 +1,239 @@
+# ------------------------------------------------------------
+# storage.py  –  space accounting and clean-up for /books and /state
+# ------------------------------------------------------------
+# Every per-book file in /state is named after the book's path (see
+# state_file()), so the files of a book are found by name and those of a
+# book that is gone are orphans.  Caches are the files the reader can
+# rebuild: page indexes (.idx), EPUB checkpoints (.chk), chapter tables
+# (.toc) and a .gtx/.pgb whose .epub is still there.  When space runs
+# short they are evicted least recently read book first; the open book's
+# are never touched.  RESERVE bytes are always left free so state saves don't
+# fail once a conversion has filled the flash.
+import os
+
+STATE_DIR = "/state"
+BOOK_DIR = "/books"
+RECENT_FILE = STATE_DIR + "/recent"
+RESERVE = 16 * 1024
+RECENT_MAX = 32
+CACHE_EXTS = (".idx", ".chk", ".toc")
+# files of a book still being converted: never orphans while the .epub exists
+WORK_EXTS = (".job",)
+DERIVED_EXTS = (".gtx", ".pgb")
+SOURCE_EXTS = (".epub", ".txt")
+GLOBAL_STATE = ("ebook_state.bin", "font", "resume.bin", "recent",
+                "trace.btr", "trace_report.txt")   # not tied to a book (buttontrace.py)
+
+
+def state_prefix(book) -> str:
+    return book.replace("/", "_").replace(".", "_")
+
+
+def state_file(book, ext) -> str:
+    return STATE_DIR + "/" + state_prefix(book) + ext
+
+
+def _size(path) -> int:
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return -1
+
+
+def _remove(path) -> int:
+    size = _size(path)
+    try:
+        os.remove(path)
+        return max(0, size)
+    except OSError:
+        return 0
+
+
+def _listdir(path) -> list:
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+def free_bytes(path="/") -> int:
+    st = os.statvfs(path)
+    return st[0] * st[3]
+
+
+# ---------------------------------------------------------------- recency
+def recent_books() -> list:
+    """Books in the order they were last opened, most recent first."""
+    try:
+        with open(RECENT_FILE) as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def touch(book):
+    """Note that book was just opened."""
+    books = recent_books()
+    if books[:1] == [book]:
+        return
+    books = [b for b in books if b != book]
+    books.insert(0, book)
+    try:
+        with open(RECENT_FILE, "w") as f:
+            for b in books[:RECENT_MAX]:
+                f.write(b + "\n")
+    except OSError as e:
+        print("recent save failed:", e)
+
+
+# ---------------------------------------------------------------- accounting
+def _state_files_of(book, state_names) -> list:
+    prefix = state_prefix(book)
+    n = len(prefix)
+    return [STATE_DIR + "/" + name for name in state_names
+            if name.startswith(prefix) and name[n:n + 1] in ("_", ".")]
+
+
+def book_files(book, state_names=None) -> list:
+    """(path, size, cache) of everything kept for book: the book itself, derived copies and state."""
+    if state_names is None:
+        state_names = _listdir(STATE_DIR)
+    base = book.rsplit(".", 1)[0]
+    has_epub = _size(base + ".epub") >= 0
+    out = []
+    for ext in SOURCE_EXTS + DERIVED_EXTS:
+        path = base + ext
+        size = _size(path)
+        if size >= 0:
+            out.append((path, size, has_epub and ext in DERIVED_EXTS and path != book))
+    for path in set(_state_files_of(base + ".epub", state_names) + _state_files_of(book, state_names)
+                    + [p for ext in DERIVED_EXTS for p in _state_files_of(base + ext, state_names)]):
+        out.append((path, max(0, _size(path)), path.endswith(CACHE_EXTS)))
+    return out
+
+
+def usage(book_dir=BOOK_DIR) -> dict:
+    """Bytes on flash per book (keyed by the path of its source, or its only file)."""
+    state_names = _listdir(STATE_DIR)
+    seen = {}
+    for name in _listdir(book_dir):
+        base = book_dir + "/" + name.rsplit(".", 1)[0]
+        if base in seen or not name.endswith(SOURCE_EXTS + DERIVED_EXTS):
+            continue
+        for ext in SOURCE_EXTS + DERIVED_EXTS:
+            if _size(base + ext) >= 0:
+                seen[base] = base + ext
+                break
+    return {book: sum(size for _, size, _ in book_files(book, state_names)) for book in seen.values()}
+
+
+# ---------------------------------------------------------------- clean-up
+def clean_orphans(book_dir=BOOK_DIR) -> int:
+    """Remove /state files of books that are gone and abandoned .part files; returns bytes freed."""
+    books = [book_dir + "/" + name for name in _listdir(book_dir)]
+    prefixes = [state_prefix(b) for b in books]
+    freed = 0
+    for name in _listdir(STATE_DIR):
+        if name in GLOBAL_STATE:
+            continue
+        owned = False
+        for p in prefixes:
+            if name.startswith(p) and name[len(p):len(p) + 1] in ("_", "."):
+                owned = True
+                break
+        if not owned:
+            freed += _remove(STATE_DIR + "/" + name)
+    for path in books:
+        # a .part is only worth keeping while its EPUB (and job checkpoint) exist
+        if path.endswith(".part"):
+            base = path[:-5].rsplit(".", 1)[0]
+            if _size(base + ".epub") < 0:
+                freed += _remove(path)
+    return freed
+
+
+def _base(path):
+    return path.rsplit(".", 1)[0]
+
+
+def _caches(books, state_names) -> list:
+    caches = []
+    for book in books:
+        files = [(p, s) for p, s, cache in book_files(book, state_names) if cache]
+        # indexes and checkpoints before whole converted books
+        files.sort(key=lambda f: f[0].endswith(DERIVED_EXTS))
+        caches.extend(files)
+    return caches
+
+
+def cache_bytes() -> int:
+    """Bytes taken by caches of all books."""
+    return sum(s for _, s in _caches(usage(), _listdir(STATE_DIR)))
+
+
+def evict(need, keep=(), quota=None) -> int:
+    """
+    Evict caches, least recently read book first, until need bytes (plus
+    RESERVE) are free and the caches total at most quota bytes.  Nothing
+    of the books in keep is touched.  Returns bytes freed.
+    """
+    state_names = _listdir(STATE_DIR)
+    recent = [_base(b) for b in recent_books()]
+    keep = [_base(b) for b in keep]
+    books = [b for b in usage() if _base(b) not in keep]
+
+    def age(book):
+        base = _base(book)
+        return recent.index(base) if base in recent else RECENT_MAX
+
+    # never read first, then oldest read first
+    books.sort(key=lambda b: -age(b))
+    caches = _caches(books, state_names)
+    total = cache_bytes()
+    freed = 0
+    for path, size in caches:
+        short = free_bytes() < need + RESERVE
+        over = quota is not None and total > quota
+        if not short and not over:
+            break
+        freed += _remove(path)
+        total -= size
+    return freed
+
+
+def evictable(keep=()) -> int:
+    """Bytes evict() could free without touching the books in keep."""
+    keep = [_base(b) for b in keep]
+    books = [b for b in usage() if _base(b) not in keep]
+    return sum(s for _, s in _caches(books, _listdir(STATE_DIR)))
+
+
+def ensure_space(need, keep=(), allow_evict=True) -> bool:
+    """
+    True if need bytes can be written while keeping RESERVE free, evicting
+    caches if that helps (and allow_evict).  The most recently read book is
+    kept as well.  Nothing is evicted when even all of it wouldn't be enough.
+    """
+    if free_bytes() >= need + RESERVE:
+        return True
+    clean_orphans()
+    free = free_bytes()
+    if free >= need + RESERVE:
+        return True
+    if not allow_evict:
+        return False
+    keep = tuple(keep) + tuple(recent_books()[:1])
+    if free + evictable(keep) < need + RESERVE:
+        return False
+    evict(need, keep)
+    return free_bytes() >= need + RESERVE
+
+
+def remove_converted_source(epub, converted, expected_size) -> bool:
+    """Delete epub once converted is in place with exactly expected_size bytes."""
+    if expected_size <= 0 or _size(converted) != expected_size:
+        return False
+    _remove(epub)
+    for path in _state_files_of(epub, _listdir(STATE_DIR)):
+        _remove(path)
+    return True
@@ -2,8 +2,16 @@
 # uzipfile.py  –  pure-Python ZIP reader for MicroPython
 # ------------------------------------------------------------
 import deflate
+import io
 import struct
-from io import BytesIO
+from array import array
+
+INPUT_BUFFER_SIZE = 1024   # compressed bytes pulled from flash per refill
+WBITS = 15                 # ZIP DEFLATE streams may use the full 32 KB window
+EOCD_SIG = b"\x50\x4b\x05\x06"
+CD_SIG = b"\x50\x4b\x01\x02"
+CD_HEADER_SIZE = 46
+CD_CHUNK = 1024
 
 
 class FileSliceReader:
@@ -12,7 +20,6 @@ class FileSliceReader:
         self.fp = fp
         self.pos = start
         self.end = start + size
-        self.fp.seek(start)
 
     def read(self, size=-1):
         if size < 0:
@@ -22,104 +29,208 @@ class FileSliceReader:
             size = remaining
         if size <= 0:
             return b""
+        self.fp.seek(self.pos)  # fp is shared, another reader may have moved it
         data = self.fp.read(size)
         self.pos += len(data)
         return data
 
+    def readinto(self, b):
+        n = min(len(b), self.end - self.pos)
+        if n <= 0:
+            return 0
+        self.fp.seek(self.pos)
+        got = self.fp.readinto(b if n == len(b) else memoryview(b)[:n]) or 0
+        self.pos += got
+        return got
+
+    def close(self):
+        pass  # fp is shared, don't close
+
+
+class BufferedSliceReader(io.IOBase):
+    """
+    Stream over a file slice through one reusable input buffer.
+
+    DeflateIO needs a real stream object and pulls its input in tiny
+    reads, so this refills buf_size bytes at a time from the shared fp
+    with readinto().  Memory stays at buf_size whatever the slice size;
+    pass buf to reuse one buffer for every member.
+    """
+    def __init__(self, fp, start, size, buf_size=INPUT_BUFFER_SIZE, buf=None):
+        self.fp = fp
+        self.pos = start            # file offset of the next refill
+        self.end = start + size
+        self.buf = buf if buf is not None else bytearray(min(buf_size, size) or 1)
+        self.mv = memoryview(self.buf)
+        self.head = 0
+        self.tail = 0
+
+    def _refill(self):
+        n = min(len(self.buf), self.end - self.pos)
+        if n <= 0:
+            return 0
+        self.fp.seek(self.pos)      # fp is shared, another reader may have moved it
+        got = self.fp.readinto(self.mv[:n]) or 0
+        self.pos += got
+        self.head = 0
+        self.tail = got
+        return got
+
+    def readinto(self, b):
+        if self.head == self.tail and not self._refill():
+            return 0
+        n = min(len(b), self.tail - self.head)
+        b[:n] = self.mv[self.head:self.head + n]
+        self.head += n
+        return n
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.end - self.pos + self.tail - self.head
+        out = bytearray(size)
+        mv = memoryview(out)
+        got = 0
+        while got < size:
+            n = self.readinto(mv[got:])
+            if not n:
+                break
+            got += n
+        return bytes(mv[:got])
+
     def close(self):
         pass  # fp is shared, don't close
 
 
 class UZipFile:
-    """Read-only ZIP archive that only needs DEFLATE (method 8) or stored (0)."""
+    """
+    Read-only ZIP archive that only needs DEFLATE (method 8) or stored (0).
+
+    The central directory is kept as parallel arrays plus a name → index
+    dict, so lookups are O(1) and an EPUB with hundreds of members costs a
+    few KB.  Pass exts=(".html", ...) to drop every other member (images,
+    fonts) while the directory is parsed.
+    """
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, in_buf_size: int = INPUT_BUFFER_SIZE, exts=None):
         self.fp = open(filename, "rb")
-        self.filelist = self._read_central_directory()
+        self.in_buf_size = in_buf_size
+        self.names = []                 # kept member names, in directory order
+        self.index = {}                 # name -> position in the arrays below
+        self.method = bytearray()       # compression method (255 = unsupported)
+        self.csize = array("I")         # compressed size
+        self.usize = array("I")         # uncompressed size
+        self.offset = array("I")        # local file header offset
+        self._read_central_directory(
+            tuple(e.lower().encode() for e in exts) if exts else None)
 
     # -----------------------------------------------------------------
-    def _read_central_directory(self):
-        self.fp.seek(0, 2)
-        file_size = self.fp.tell()
-
-        # ---- find End Of Central Directory (EOCD) -----------------
+    def _find_eocd(self, file_size):
+        # Common case: no archive comment, EOCD is the last 22 bytes
+        if file_size >= 22:
+            self.fp.seek(file_size - 22)
+            tail = self.fp.read(22)
+            if tail[:4] == EOCD_SIG:
+                return file_size - 22
         SEARCH = 65535 + 22
         start = max(0, file_size - SEARCH)
         self.fp.seek(start)
         tail = self.fp.read(file_size - start)
-
-        eocd_sig = b"\x50\x4b\x05\x06"
-        pos = tail.rfind(eocd_sig)
+        pos = tail.rfind(EOCD_SIG)
         if pos == -1:
             raise OSError("Not a valid ZIP file (EOCD missing)")
+        return start + pos
 
-        eocd_start = start + pos
+    def _read_central_directory(self, exts):
+        self.fp.seek(0, 2)
+        file_size = self.fp.tell()
+
+        # ---- find End Of Central Directory (EOCD) -----------------
+        eocd_start = self._find_eocd(file_size)
         self.fp.seek(eocd_start + 16)
         cd_offset = struct.unpack("<I", self.fp.read(4))[0]
 
-        # ---- read Central Directory entries -----------------------
+        # ---- read Central Directory entries in bulk ---------------
         self.fp.seek(cd_offset)
-        files = []
-
+        buf = b""
+        pos = 0
         while True:
-            header = self.fp.read(46)
-            if len(header) < 46 or header[:4] != b"\x50\x4b\x01\x02":
+            if len(buf) - pos < CD_HEADER_SIZE:
+                buf = buf[pos:] + self.fp.read(CD_CHUNK)
+                pos = 0
+                if len(buf) < CD_HEADER_SIZE:
+                    break
+            if buf[pos:pos + 4] != CD_SIG:
                 break
+            method, = struct.unpack_from("<H", buf, pos + 10)
+            csize, usize, name_len, extra_len, comment_len = struct.unpack_from("<IIHHH", buf, pos + 20)
+            lfh_offset, = struct.unpack_from("<I", buf, pos + 42)
+            name_end = pos + CD_HEADER_SIZE + name_len
+            if name_end > len(buf):
+                buf = buf[pos:] + self.fp.read(CD_CHUNK + name_len)
+                pos = 0
+                continue
+            name = buf[name_end - name_len:name_end]
+            pos = name_end + extra_len + comment_len
+            if pos > len(buf):          # extra/comment run past the buffer
+                self.fp.seek(pos - len(buf), 1)
+                buf = b""
+                pos = 0
+
+            if exts and not name.lower().endswith(exts):
+                continue
+            name = name.decode("utf-8")
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.method.append(method if method in (0, 8) else 255)
+            self.csize.append(csize)
+            self.usize.append(usize)
+            self.offset.append(lfh_offset)
 
-            comp_method, = struct.unpack("<H", header[10:12])
-            comp_size, = struct.unpack("<I", header[20:24])
-            uncomp_size, = struct.unpack("<I", header[24:28])
-            name_len, = struct.unpack("<H", header[28:30])
-            extra_len, = struct.unpack("<H", header[30:32])
-            comment_len, = struct.unpack("<H", header[32:34])
-            lfh_offset, = struct.unpack("<I", header[42:46])
-
-            name = self.fp.read(name_len).decode("utf-8")
-            self.fp.seek(extra_len + comment_len, 1)   # skip
-
-            files.append({
-                "filename": name,
-                "compression_method": comp_method,
-                "compressed_size": comp_size,
-                "uncompressed_size": uncomp_size,
-                "lfl_offset": lfh_offset,
-            })
+    # -----------------------------------------------------------------
+    def namelist(self):
+        return list(self.names)
 
-        return files
+    def __contains__(self, member):
+        return member in self.index
 
     # -----------------------------------------------------------------
-    def namelist(self):
-        return [f["filename"] for f in self.filelist]
+    def file_size(self, member: str) -> int:
+        """Uncompressed size of member (0 if unknown)."""
+        i = self.index.get(member)
+        return self.usize[i] if i is not None else 0
+
+    def raw_entry(self, member: str):
+        """(data start in fp, compressed size, method) of member, for callers that read fp themselves."""
+        i, data_start = self._get_entry(member)
+        return data_start, self.csize[i], self.method[i]
 
     # -----------------------------------------------------------------
     def _get_entry(self, member: str):
-        entry = next((f for f in self.filelist if f["filename"] == member), None)
-        if entry is None:
+        i = self.index.get(member)
+        if i is None:
             raise KeyError(member)
 
         # ---- go to Local File Header -------------------------------
-        self.fp.seek(entry["lfl_offset"])
+        self.fp.seek(self.offset[i])
         lfh = self.fp.read(30)
-        name_len, = struct.unpack("<H", lfh[26:28])
-        extra_len, = struct.unpack("<H", lfh[28:30])
+        name_len, extra_len = struct.unpack_from("<HH", lfh, 26)
 
-        data_start = entry["lfl_offset"] + 30 + name_len + extra_len
-        return entry, data_start
+        data_start = self.offset[i] + 30 + name_len + extra_len
+        return i, data_start
 
     # -----------------------------------------------------------------
     def read(self, member: str):
         # Legacy: full read (for small files if needed)
-        entry, data_start = self._get_entry(member)
-        self.fp.seek(data_start)
-        compressed = self.fp.read(entry["compressed_size"])
+        i, data_start = self._get_entry(member)
 
-        if entry["compression_method"] == 0:
-            return compressed
+        if self.method[i] == 0:
+            self.fp.seek(data_start)
+            return self.fp.read(self.csize[i])
 
-        if entry["compression_method"] == 8:
-            stream = BytesIO(compressed)
+        if self.method[i] == 8:
+            stream = BufferedSliceReader(self.fp, data_start, self.csize[i], self.in_buf_size)
             try:
-                d = deflate.DeflateIO(stream, deflate.RAW, 15)
+                d = deflate.DeflateIO(stream, deflate.RAW, WBITS)
                 data = d.read()
                 d.close()
                 return data
@@ -128,29 +239,35 @@ class UZipFile:
                 return b""
 
         raise NotImplementedError(
-            f"Compression method {entry['compression_method']} not supported"
+            f"Compression method of {member} not supported"
         )
 
     # -----------------------------------------------------------------
-    def get_reader(self, member: str):
-        """Return a streaming reader for the member (DeflateIO or file slice)."""
-        entry, data_start = self._get_entry(member)
-
-        if entry["compression_method"] == 0:  # stored: stream from fp slice
-            return FileSliceReader(self.fp, data_start, entry["compressed_size"])
-
-        if entry["compression_method"] == 8:  # DEFLATE: load compressed (small), stream decompress
-            self.fp.seek(data_start)
-            compressed = self.fp.read(entry["compressed_size"])
-            stream = BytesIO(compressed)
+    def get_reader(self, member: str, buf_size: int = 0, buf=None):
+        """
+        Return a streaming reader for the member (DeflateIO or file slice).
+
+        DEFLATE input is pulled from flash through a buf_size buffer
+        (default in_buf_size), or through buf if given, so memory is the
+        32 KB window plus that buffer, never the member size.  Both
+        readers support readinto().
+        """
+        i, data_start = self._get_entry(member)
+
+        if self.method[i] == 0:  # stored: stream from fp slice
+            return FileSliceReader(self.fp, data_start, self.csize[i])
+
+        if self.method[i] == 8:  # DEFLATE: stream compressed input, stream decompress
+            stream = BufferedSliceReader(self.fp, data_start, self.csize[i],
+                                         buf_size or self.in_buf_size, buf)
             try:
-                return deflate.DeflateIO(stream, deflate.RAW, 15)
+                return deflate.DeflateIO(stream, deflate.RAW, WBITS)
             except Exception as e:
                 print(f"[UZIP ERROR] {member}: {e}")
                 raise  # re-raise to handle in caller
 
         raise NotImplementedError(
-            f"Compression method {entry['compression_method']} not supported"
+            f"Compression method of {member} not supported"
         )
 
     # -----------------------------------------------------------------